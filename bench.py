@@ -0,0 +1,426 @@
+"""Нагрузочный бенчмарк обработчиков бота без подключения к Discord.
+
+Обработчики из main.py вызываются с заглушками Interaction, Guild, Member и
+Channel на временном файле SQLite. Для каждого сценария печатаются p50/p95/p99
+задержки и число операций в секунду при заданной параллельности. Сценарий
+outbox выполняет фоновые эффекты одобрения (роли, ЛС) по одной записи вместе
+с зависимыми записями (easywl add после роли вайтлиста), сценарий rcon —
+команды easywl add через общую очередь RCON. От --rcon и --rcon-delay зависят
+сценарии accept, outbox и rcon.
+
+Примеры:
+    python bench.py
+    python bench.py --flows accept karma --concurrency 50 --ops 1000
+    python bench.py --discord-delay 0.05 --rcon-delay 0.02
+    python bench.py --rcon 127.0.0.1:25575 --rcon-password secret
+    python bench.py --output bench_output.txt
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import discord
+from discord import app_commands
+
+import main
+
+FLOWS = ("apply", "accept", "outbox", "rcon", "karma", "countries")
+COUNTRIES = ["Лефринтия", "Карфаген", "Оствальд", "Нордмарк", "Эльдария"]
+
+
+# ========== ЗАГЛУШКИ DISCORD ==========
+class FakeApi:
+    """Имитация задержки REST API Discord"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+
+class FakeResponse:
+    def __init__(self, api: FakeApi):
+        self.api = api
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, *args, **kwargs):
+        self._done = True
+        await self.api.call()
+
+    async def defer(self, **kwargs):
+        self._done = True
+        await self.api.call()
+
+    async def send_modal(self, modal):
+        self._done = True
+        await self.api.call()
+
+
+class FakeFollowup:
+    def __init__(self, api: FakeApi):
+        self.api = api
+
+    async def send(self, *args, **kwargs):
+        await self.api.call()
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+        self.mention = f"<@&{role_id}>"
+
+
+class FakeMember:
+    def __init__(self, user_id: int, api: FakeApi):
+        self.id = user_id
+        self.api = api
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.guild_permissions = discord.Permissions.all()
+
+    def __str__(self):
+        return self.name
+
+    async def add_roles(self, *roles, **kwargs):
+        await self.api.call()
+
+    async def remove_roles(self, *roles, **kwargs):
+        await self.api.call()
+
+    async def send(self, *args, **kwargs):
+        await self.api.call()
+
+
+class FakeGuild:
+    def __init__(self, api: FakeApi, roles: List[FakeRole]):
+        self.id = 1
+        self.name = "Кармалис"
+        self.api = api
+        self._roles = {role.id: role for role in roles}
+
+    def get_role(self, role_id: int):
+        return self._roles.get(role_id)
+
+    def get_member(self, user_id: int):
+        return None
+
+    async def fetch_member(self, user_id: int):
+        await self.api.call()
+        return FakeMember(user_id, self.api)
+
+    async def ban(self, user, **kwargs):
+        await self.api.call()
+
+
+class FakeMessage:
+    _ids = itertools.count(10**17)
+
+    def __init__(self, api: FakeApi, embed=None):
+        self.id = next(self._ids)
+        self.api = api
+        self.embeds = [embed] if embed else []
+
+    async def edit(self, **kwargs):
+        await self.api.call()
+
+
+class FakeChannel:
+    def __init__(self, api: FakeApi):
+        self.id = main.APPLICATIONS_CHANNEL_ID
+        self.name = "заявки"
+        self.api = api
+
+    async def send(self, *args, **kwargs):
+        await self.api.call()
+        return FakeMessage(self.api, kwargs.get("embed"))
+
+    def get_partial_message(self, message_id: int):
+        return FakeMessage(self.api)
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember, guild: FakeGuild, message=None):
+        self.user = user
+        self.guild = guild
+        self.message = message
+        self.response = FakeResponse(user.api)
+        self.followup = FakeFollowup(user.api)
+
+
+class FakeRconDispatcher:
+    """Имитация очереди RCON с фиксированной задержкой ответа"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.breaker = main.CircuitBreaker()
+
+    async def submit(self, command: str) -> str:
+        await asyncio.sleep(self.delay)
+        return f"Added {command.split()[-1]} to the whitelist"
+
+    async def close(self):
+        pass
+
+
+# ========== СЦЕНАРИИ ==========
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.api = FakeApi(args.discord_delay)
+        self.guild = FakeGuild(
+            self.api,
+            [FakeRole(main.WHITELIST_ROLE_ID, "Вайтлист")]
+            + [FakeRole(1000 + i, name) for i, name in enumerate(COUNTRIES)],
+        )
+        self.channel = FakeChannel(self.api)
+        self.moderator = FakeMember(1, self.api)
+        self._user_ids = itertools.count(10**6)
+
+    async def setup(self, db_path: str):
+        main.database = main.AsyncDatabase(main.Database(db_path))
+        main.bot.get_channel = lambda channel_id: self.channel
+        main.bot.get_user = lambda user_id: FakeMember(user_id, self.api)
+        main.bot.get_guild = lambda guild_id: self.guild
+
+        if self.args.rcon:
+            host, port = self.args.rcon.rsplit(":", 1)
+            main.RCON_HOST, main.RCON_PORT = host, int(port)
+            main.RCON_PASSWORD = self.args.rcon_password
+            main.rcon_pool = main.RconPool()
+            main.rcon_dispatcher = main.RconDispatcher(main.rcon_pool)
+        else:
+            main.rcon_dispatcher = FakeRconDispatcher(self.args.rcon_delay)
+
+        for i, name in enumerate(COUNTRIES):
+            await main.database.create_country(name, 1000 + i)
+            await main.database.modify_karma_value(name, random.randint(-50, 200))
+        await main.database.flush_karma()
+
+    async def close(self):
+        await main.rcon_dispatcher.close()
+        await main.rcon_pool.close()
+        main.database.close()
+
+    def new_member(self) -> FakeMember:
+        return FakeMember(next(self._user_ids), self.api)
+
+    async def prepare_apply(self, ops: int) -> List[Callable[[], Awaitable]]:
+        async def op():
+            modal = main.UserFormModal()
+            member = self.new_member()
+            modal.minecraft_username._value = f"Player{member.id}"
+            modal.country._value = random.choice(COUNTRIES)
+            modal.rules._value = "Да"
+            await modal.on_submit(FakeInteraction(member, self.guild))
+
+        return [op] * ops
+
+    async def prepare_accept(self, ops: int) -> List[Callable[[], Awaitable]]:
+        button = main.AdminView().children[0]
+        operations = []
+        for _ in range(ops):
+            member = self.new_member()
+            nickname, country = f"Player{member.id}", random.choice(COUNTRIES)
+            application_id = await main.database.create_application(
+                member.id, nickname, country, "Да"
+            )
+            message = FakeMessage(
+                self.api, main.application_embed(member.id, nickname, country, "Да")
+            )
+            await main.database.set_application_message(application_id, message.id)
+
+            async def op(message=message):
+                await button.callback(
+                    FakeInteraction(self.moderator, self.guild, message)
+                )
+
+            operations.append(op)
+        return operations
+
+    async def prepare_outbox(self, ops: int) -> List[Callable[[], Awaitable]]:
+        effects = main.acceptance_effects(
+            self.guild, self.moderator, self.guild.get_role(main.WHITELIST_ROLE_ID)
+        )
+        operations = []
+        while len(operations) < ops:
+            member = self.new_member()
+            application = {"discord_id": member.id, "minecraft": f"Player{member.id}"}
+            registration = {"country": COUNTRIES[0], "citizen_role_id": 1000}
+            for kind, payload in effects(application, registration):
+
+                async def op(kind=kind, payload=payload):
+                    # Как OutboxWorker: зависимые записи — после успешной основной
+                    await main.OUTBOX_HANDLERS[kind](payload)
+                    for dependent, data in payload.get("then", ()):
+                        await main.OUTBOX_HANDLERS[dependent](data)
+
+                operations.append(op)
+        return operations[:ops]
+
+    async def prepare_rcon(self, ops: int) -> List[Callable[[], Awaitable]]:
+        async def op():
+            nickname = f"Player{next(self._user_ids)}"
+            response = await main.rcon_dispatcher.submit(f"easywl add {nickname}")
+            if nickname.casefold() not in response.casefold():
+                raise RuntimeError(f"Неожиданный ответ RCON: {response!r}")
+
+        return [op] * ops
+
+    async def prepare_karma(self, ops: int) -> List[Callable[[], Awaitable]]:
+        periods = [None] + [
+            app_commands.Choice(name=label, value=period)
+            for period, label in main.KARMA_PERIODS.items()
+        ]
+        every = self.args.invalidate_every
+        counter = itertools.count(1)
+
+        async def op():
+            if every and next(counter) % every == 0:
+                await main.database.modify_karma_value(random.choice(COUNTRIES), 1)
+            await main.show_karma.callback(
+                FakeInteraction(self.new_member(), self.guild),
+                None,
+                random.choice(periods),
+            )
+
+        return [op] * ops
+
+    async def prepare_countries(self, ops: int) -> List[Callable[[], Awaitable]]:
+        every = self.args.invalidate_every
+        counter = itertools.count(1)
+
+        async def op():
+            if every and next(counter) % every == 0:
+                await main.database.modify_karma_value(random.choice(COUNTRIES), 1)
+            await main.list_countries.callback(
+                FakeInteraction(self.new_member(), self.guild)
+            )
+
+        return [op] * ops
+
+    async def run(self, flow: str) -> Dict[str, float]:
+        operations = await getattr(self, f"prepare_{flow}")(self.args.ops)
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        latencies: List[float] = []
+        errors = 0
+
+        async def timed(op):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await op()
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        calls_before = self.api.calls
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(op) for op in operations))
+        elapsed = time.perf_counter() - started
+        return {
+            "ops": len(operations),
+            "errors": errors,
+            "ops_per_sec": len(operations) / elapsed,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "api_calls": (self.api.calls - calls_before) / len(operations),
+        }
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+
+def format_report(args, results: Dict[str, Dict[str, float]]) -> str:
+    lines = [
+        f"Параллельность: {args.concurrency}, операций на сценарий: {args.ops}, "
+        f"задержка Discord: {args.discord_delay * 1000:.0f} мс, "
+        + (
+            f"RCON: {args.rcon}"
+            if args.rcon
+            else f"задержка RCON: {args.rcon_delay * 1000:.0f} мс"
+        ),
+        "",
+        f"{'сценарий':<10} {'оп/с':>9} {'p50, мс':>9} {'p95, мс':>9} "
+        f"{'p99, мс':>9} {'API/оп':>7} {'ошибок':>7}",
+    ]
+    for flow, r in results.items():
+        lines.append(
+            f"{flow:<10} {r['ops_per_sec']:>9.1f} {r['p50']:>9.2f} {r['p95']:>9.2f} "
+            f"{r['p99']:>9.2f} {r['api_calls']:>7.1f} {r['errors']:>7}"
+        )
+    return "\n".join(lines)
+
+
+async def run_bench(args):
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        bench = Bench(args)
+        await bench.setup(os.path.join(directory, "bench.db"))
+        try:
+            results = {flow: await bench.run(flow) for flow in args.flows}
+        finally:
+            await bench.close()
+
+    report = format_report(args, results)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--flows", nargs="+", choices=FLOWS, default=list(FLOWS), help="Сценарии"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="Одновременных операций"
+    )
+    parser.add_argument("--ops", type=int, default=200, help="Операций на сценарий")
+    parser.add_argument(
+        "--discord-delay",
+        type=float,
+        default=0.0,
+        help="Задержка каждого вызова Discord API, сек",
+    )
+    parser.add_argument(
+        "--rcon-delay",
+        type=float,
+        default=0.01,
+        help="Задержка имитации RCON, сек (без --rcon)",
+    )
+    parser.add_argument(
+        "--rcon", help="host:port настоящего RCON-сервера, например rcon_stub.py"
+    )
+    parser.add_argument("--rcon-password", default=os.getenv("RCON_PASSWORD"))
+    parser.add_argument(
+        "--invalidate-every",
+        type=int,
+        default=0,
+        help="Менять карму каждые N операций karma/countries (сброс кэша рейтингов)",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Файл для копии отчёта")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_bench(parse_args()))
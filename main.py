@@ -1,86 +1,931 @@
 import asyncio
+import collections
+import contextlib
+import datetime
+import functools
+import hashlib
+import itertools
+import json
+import math
 import os
+import signal
+import pathlib
+import re
 import socket
 import sqlite3
-from typing import List, Optional
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
 import discord
 from aiohttp import web
 from discord import app_commands
 from discord.ui import Button, Modal, TextInput, View
-from rcon.source import Client
 
 # ========== КОНФИГУРАЦИЯ ==========
 # ЗАМЕНИТЕ ЭТИ ЗНАЧЕНИЯ НА СВОИ!
 TOKEN = os.getenv("DISCORD_TOKEN")
-RCON_HOST = "karmalis.ru"  # Пример: "123.123.123.123"
-RCON_PORT = 25794  # Стандартный порт RCON
+# Адрес RCON можно переопределить, например для локальной заглушки rcon_stub.py
+RCON_HOST = os.getenv("RCON_HOST", "karmalis.ru")  # Пример: "123.123.123.123"
+RCON_PORT = int(os.getenv("RCON_PORT", "25794"))  # Стандартный порт RCON
 RCON_PASSWORD = os.getenv("RCON_PASSWORD")  # Пароль из server.properties
+RCON_TIMEOUT = 5.0  # Таймаут RCON-запроса, сек
+RCON_POOL_SIZE = 2  # Количество постоянных RCON-соединений
+# Сколько команд можно отправить в одно соединение, не дожидаясь ответа.
+# Ванильный Minecraft читает из сокета ровно один пакет за раз, поэтому 1;
+# серверы с корректной буферизацией RCON выдерживают больше.
+RCON_PIPELINE_DEPTH = 1
+RCON_KEEPALIVE_INTERVAL = 60  # Проверка простаивающих RCON-соединений, сек
+RCON_BATCH_WINDOW = 0.05  # Окно сбора RCON-команд в одну пачку, сек
+RCON_BATCH_SIZE = 32  # Пачка отправляется сразу, набрав столько команд
+RCON_CALL_BUDGET = 3.0  # Сколько вызывающий ждёт ответа RCON, включая очередь, сек
+RCON_BREAKER_FAILURES = 3  # Неудачных отправок подряд до размыкания RCON
+RCON_BREAKER_RESET = 30.0  # Через сколько секунд разомкнутый RCON пробуется снова
+ACCEPT_STEP_TIMEOUT = 10.0  # Таймаут каждого шага одобрения заявки, сек
+OUTBOX_POLL_INTERVAL = 5.0  # Как часто проверять отложенные повторы outbox, сек
+OUTBOX_BATCH = 50  # Сколько записей outbox выполнять за один проход
+OUTBOX_CONCURRENCY = 5  # Одновременно выполняемых записей outbox
+OUTBOX_RETRY_BASE = 5.0  # Первая пауза перед повтором, дальше удваивается, сек
+OUTBOX_RETRY_MAX = 900.0  # Максимальная пауза между повторами, сек
+OUTBOX_MAX_ATTEMPTS = 10  # После стольких неудач запись помечается failed
+OUTBOX_INLINE_LEASE = 60.0  # Столько фоновый обработчик не берёт записи, выполняемые сразу, сек
+WHITELIST_RECONCILE_INTERVAL = 3600  # Период сверки вайтлиста сервера с БД, сек
+WHITELIST_RECONCILE_MAX_REMOVALS = 20  # Больше удалений за проход не выполняются, только в отчёт
+BULK_CONCURRENCY = 5  # Одновременных запросов к Discord при массовой обработке заявок
+BULK_REPORT_LINES = 20  # Сколько заявок перечислять в итоговом отчёте
 WHITELIST_ROLE_ID = 1446108377766690816  # ID роли для вайтлиста в Discord
 LEADER_ROLE_ID = 1450529742712471723
 APPLICATIONS_CHANNEL_ID = 1446140359901057198  # Канал для заявок
 ANNOUNCEMENT_CHANNEL_ID = 1446108086258634773  # Канал для кнопки регистрации
+DB_PATH = "karmator.db"  # Файл базы данных SQLite
+DB_READERS = 4  # Количество потоков-читателей БД
+DB_CACHE_SIZE_KB = 16384  # Кэш страниц SQLite на соединение, КБ
+DB_MMAP_SIZE = 256 * 1024 * 1024  # Объём файла БД, читаемого через mmap, байт
+KARMA_FLUSH_INTERVAL = 5.0  # Период записи накопленной кармы в БД, сек
+KARMA_FLUSH_THRESHOLD = 100  # Запись без ожидания периода после стольких изменений
+LOOP_LAG_INTERVAL = 0.5  # Период замера задержки event loop, сек
+LOOP_LAG_SAMPLES = 600  # Сколько последних замеров хранить для статистики
+SLOW_STEP_THRESHOLD = 0.1  # Шаг обработчика дольше этого блокирует loop, сек
+# Ограничение частоты взаимодействий (token bucket): ёмкость и пополнение в секунду
+USER_RATE_BURST = 5  # Команд и кнопок подряд от одного пользователя
+USER_RATE_PER_SEC = 0.5
+GLOBAL_RATE_BURST = 60  # Взаимодействий подряд от всех пользователей вместе
+GLOBAL_RATE_PER_SEC = 20.0
+REGISTRATION_RATE_BURST = 4  # Нажатий «Подать заявку» и отправок анкеты от одного пользователя
+REGISTRATION_RATE_PER_SEC = 1 / 30
+MODERATION_RATE_BURST = 30  # Кнопок и окон заявок подряд от одного модератора
+MODERATION_RATE_PER_SEC = 2.0
+API_PAGE_SIZE = 50  # Размер страницы JSON API по умолчанию
+API_MAX_PAGE_SIZE = 200  # Максимальный размер страницы JSON API
+HEALTH_PROBE_INTERVAL = 15  # Период фоновой проверки БД и RCON, сек
+HEALTH_PROBE_TTL = 45  # Результат проверки старше этого считается устаревшим, сек
+HEALTH_PROBE_TIMEOUT = 5.0  # Таймаут одной проверки, сек
+
+# Кэш участников сервера: нужен привилегированный интент Server Members
+# в настройках приложения. Без него участники запрашиваются через REST.
+MEMBER_CACHE = os.getenv("MEMBER_CACHE", "0") == "1"
+
+# Удаление из вайтлиста игроков без регистрации при сверке. По умолчанию
+# выключено: сверка только добавляет и сообщает о лишних. Перед включением
+# перечислите в WHITELIST_EXEMPT администрацию и внесённых вручную
+WHITELIST_RECONCILE_REMOVE = os.getenv("WHITELIST_RECONCILE_REMOVE", "0") == "1"
+# Ники через запятую, которые сверка не удаляет из вайтлиста (администрация,
+# игроки, внесённые вручную без регистрации)
+WHITELIST_EXEMPT = {
+    nickname.strip().casefold()
+    for nickname in os.getenv("WHITELIST_EXEMPT", "").split(",")
+    if nickname.strip()
+}
 
 # ========== НАСТРОЙКА БОТА ==========
 intents = discord.Intents.default()
 intents.message_content = True
-bot = discord.Client(intents=intents)
-tree = app_commands.CommandTree(bot)
+intents.members = MEMBER_CACHE
+# При включённом кэше участники загружаются до on_ready и дальше
+# обновляются событиями входа, выхода и изменения участников
+bot = discord.Client(intents=intents, chunk_guilds_at_startup=MEMBER_CACHE)
 
 
-class Database:
+# ========== МЕТРИКИ (формат Prometheus) ==========
+METRICS: List["Metric"] = []
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """Базовая метрика: имя, описание, имена меток и серии по значениям меток.
+
+    Метрики обновляются только из event loop, поэтому блокировки не нужны.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series: Dict[tuple, object] = {}
+        METRICS.append(self)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self._series.items()
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """Значение задаётся через set() или вычисляется функцией при каждом сборе"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.func = func
+
+    def set(self, value: float):
+        self._series[()] = value
+
+    def _samples(self) -> List[str]:
+        if self.func is not None:
+            self.set(self.func())
+        return super()._samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # Счётчики по корзинам, затем сумма и количество наблюдений
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+INTERACTION_SECONDS = Histogram(
+    "karmator_interaction_seconds",
+    "Время обработки команд, кнопок и форм",
+    ("kind", "name"),
+)
+INTERACTION_ERRORS = Counter(
+    "karmator_interaction_errors_total",
+    "Необработанные ошибки команд, кнопок и форм",
+    ("kind", "name"),
+)
+RCON_RTT_SECONDS = Histogram(
+    "karmator_rcon_rtt_seconds", "Время от отправки RCON-команды до полного ответа"
+)
+RCON_ERRORS = Counter("karmator_rcon_errors_total", "Ошибки RCON-команд", ("error",))
+DB_QUERY_SECONDS = Histogram(
+    "karmator_db_query_seconds",
+    "Время запросов к SQLite, включая ожидание потока",
+    ("op", "method"),
+)
+GATEWAY_LATENCY_SECONDS = Gauge(
+    "karmator_gateway_latency_seconds",
+    "Задержка heartbeat шлюза Discord",
+    lambda: bot.latency,
+)
+RCON_BREAKER_STATE = Gauge(
+    "karmator_rcon_breaker_open",
+    "Предохранитель RCON: 0 — замкнут, 0.5 — пробная попытка, 1 — разомкнут",
+    lambda: {"closed": 0, "half_open": 0.5, "open": 1}[rcon_dispatcher.breaker.state],
+)
+OUTBOX_EFFECTS = Counter(
+    "karmator_outbox_effects_total",
+    "Выполнение записей outbox по видам: done, retry, failed",
+    ("kind", "result"),
+)
+OUTBOX_PENDING = Gauge(
+    "karmator_outbox_pending",
+    "Записи outbox, ожидающие выполнения (на момент последнего прохода)",
+    lambda: outbox_worker.stats["pending"],
+)
+WHITELIST_RECONCILE_CHANGES = Counter(
+    "karmator_whitelist_reconcile_changes_total",
+    "Изменения вайтлиста при сверке с БД",
+    ("action",),
+)
+WHITELIST_RECONCILE_SECONDS = Histogram(
+    "karmator_whitelist_reconcile_seconds", "Длительность сверки вайтлиста"
+)
+RATE_LIMITED = Counter(
+    "karmator_rate_limited_total",
+    "Взаимодействия, отклонённые ограничителем частоты",
+    ("scope", "limit"),
+)
+PENDING_APPLICATIONS = Gauge(
+    "karmator_pending_applications", "Заявки, ожидающие решения модератора"
+)
+
+
+LOOP_LAG_SECONDS = Histogram(
+    "karmator_loop_lag_seconds",
+    "Задержка срабатывания таймера event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+SLOW_STEPS = Counter(
+    "karmator_slow_steps_total",
+    "Шаги обработчиков, дольше SLOW_STEP_THRESHOLD занимавшие event loop",
+    ("name",),
+)
+
+
+# ========== КОНТРОЛЬ EVENT LOOP ==========
+class LoopLagMonitor:
+    """Фоновый замер задержки event loop.
+
+    Задача засыпает на ``interval`` и сравнивает фактическое время
+    пробуждения с ожидаемым: разница — время, пока loop был занят чем-то
+    другим. Здесь же хранятся последние медленные шаги обработчиков.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, samples: int = LOOP_LAG_SAMPLES):
+        self.interval = interval
+        self.samples = collections.deque(maxlen=samples)
+        self.slow_steps = collections.deque(maxlen=20)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def record_slow_step(self, name: str, duration: float):
+        SLOW_STEPS.inc(name)
+        self.slow_steps.append(
+            {"name": name, "ms": round(duration * 1000, 1), "at": int(time.time())}
+        )
+        print(f"🐢 {name} занял event loop на {duration * 1000:.0f} мс")
+
+    def stats(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": len(ordered),
+            "last_ms": round(self.samples[-1] * 1000, 2) if self.samples else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_lag * 1000, 2),
+            "slow_step_threshold_ms": SLOW_STEP_THRESHOLD * 1000,
+            "slow_steps": list(self.slow_steps),
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+loop_monitor = LoopLagMonitor()
+
+
+class _StepTimer:
+    """Выполняет корутину по шагам и замеряет каждый шаг между await.
+
+    Шаг — участок синхронного кода, во время которого event loop не может
+    обслуживать ничего другого; долгие шаги записываются в loop_monitor.
+    """
+
+    def __init__(self, name: str, coro):
+        self.name = name
+        self.coro = coro
+
+    def _check(self, started: float):
+        duration = time.perf_counter() - started
+        if duration >= SLOW_STEP_THRESHOLD:
+            loop_monitor.record_slow_step(self.name, duration)
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.perf_counter()
+            try:
+                if error is not None:
+                    future = self.coro.throw(error)
+                else:
+                    future = self.coro.send(value)
+            except StopIteration as stop:
+                self._check(started)
+                return stop.value
+            except BaseException:
+                self._check(started)
+                raise
+            self._check(started)
+            try:
+                value, error = (yield future), None
+            except GeneratorExit:
+                self.coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+async def watch_steps(name: str, coro):
+    """Ожидает корутину, сообщая о шагах, надолго занявших event loop"""
+    return await _StepTimer(name, coro)
+
+
+def instrumented(kind: str, name: str):
+    """Замеряет время обработчика взаимодействия и считает его ошибки"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await watch_steps(f"{kind}:{name}", func(*args, **kwargs))
+            except Exception:
+                INTERACTION_ERRORS.inc(kind, name)
+                raise
+            finally:
+                INTERACTION_SECONDS.observe(time.perf_counter() - started, kind, name)
+
+        return wrapper
+
+    return decorator
+
+
+# ========== ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПРОСОВ ==========
+class TokenBucket:
+    """Корзина токенов: ``capacity`` запросов подряд, затем ``rate`` в секунду"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self) -> float:
+        """Через сколько секунд появится токен (0 — есть уже сейчас)"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Ограничитель частоты: корзина на каждого пользователя и одна общая.
+
+    Токены списываются, только если их хватает во всех проверяемых корзинах
+    (см. allow_interaction), поэтому отклонённые запросы не расходуют лимиты.
+    """
+
+    def __init__(
+        self,
+        scope: str,
+        user_burst: float,
+        user_rate: float,
+        global_burst: Optional[float] = None,
+        global_rate: Optional[float] = None,
+    ):
+        self.scope = scope
+        self.user_burst = user_burst
+        self.user_rate = user_rate
+        self.global_bucket = (
+            TokenBucket(global_burst, global_rate) if global_burst is not None else None
+        )
+        self._users: Dict[int, TokenBucket] = {}
+
+    def _prune(self, now: float):
+        # Полные корзины ничем не отличаются от новых — их можно забыть
+        self._users = {
+            user_id: bucket
+            for user_id, bucket in self._users.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate < bucket.capacity
+        }
+
+    def _buckets(self, user_id: int, now: float) -> List[Tuple[str, TokenBucket]]:
+        if len(self._users) > 10000:
+            self._prune(now)
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_burst, self.user_rate)
+        buckets = [("user", bucket)]
+        if self.global_bucket is not None:
+            buckets.append(("global", self.global_bucket))
+        return buckets
+
+    def check(self, user_id: int, now: float) -> Optional[Tuple[str, float]]:
+        """Проверяет без списания; при превышении — (какой лимит, сколько ждать)"""
+        for limit, bucket in self._buckets(user_id, now):
+            bucket.refill(now)
+            if bucket.tokens < 1:
+                return limit, bucket.retry_after()
+        return None
+
+    def take(self, user_id: int, now: float):
+        """Списывает токен из корзин, уже проверенных check()"""
+        for _, bucket in self._buckets(user_id, now):
+            bucket.tokens -= 1
+
+
+interaction_limiter = RateLimiter(
+    "interactions",
+    USER_RATE_BURST,
+    USER_RATE_PER_SEC,
+    GLOBAL_RATE_BURST,
+    GLOBAL_RATE_PER_SEC,
+)
+# Регистрация дополнительно ограничена своим, более строгим лимитом
+registration_limiter = RateLimiter(
+    "registration", REGISTRATION_RATE_BURST, REGISTRATION_RATE_PER_SEC
+)
+# Модераторам — свой лимит: разбор очереди заявок (кнопка и окно на каждую)
+# не должен упираться в лимит обычных пользователей
+moderation_limiter = RateLimiter(
+    "moderation", MODERATION_RATE_BURST, MODERATION_RATE_PER_SEC
+)
+
+
+def admin_limiter(interaction: discord.Interaction) -> RateLimiter:
+    """Лимит для кнопок и окон заявок: модераторский для держателей manage_roles"""
+    permissions = getattr(interaction.user, "guild_permissions", None)
+    if permissions is not None and permissions.manage_roles:
+        return moderation_limiter
+    return interaction_limiter
+
+
+async def allow_interaction(
+    interaction: discord.Interaction, *limiters: RateLimiter
+) -> bool:
+    """Проверяет лимиты; при превышении сразу отвечает коротким эфемерным отказом.
+
+    Токены списываются, только если все лимиты пропускают запрос.
+    """
+    now = time.monotonic()
+    user_id = interaction.user.id
+    for limiter in limiters:
+        rejected = limiter.check(user_id, now)
+        if rejected is None:
+            continue
+        limit, retry_after = rejected
+        RATE_LIMITED.inc(limiter.scope, limit)
+        if limit == "global":
+            text = "⏳ Бот сейчас перегружен. Попробуйте через {} с."
+        else:
+            text = "⏳ Слишком много запросов. Попробуйте через {} с."
+        await interaction.response.send_message(
+            text.format(math.ceil(retry_after)), ephemeral=True
+        )
+        return False
+    for limiter in limiters:
+        limiter.take(user_id, now)
+    return True
+
+
+class RateLimitedTree(app_commands.CommandTree):
+    """Дерево команд, пропускающее слэш-команды через ограничитель частоты"""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await allow_interaction(interaction, interaction_limiter)
+
+
+tree = RateLimitedTree(bot)
+
+
+class CountryIndex:
+    """Индекс стран в памяти: по названию (без учёта регистра) и по ID роли.
+
+    Строки хранятся в формате таблицы countries:
+    (countryId, name, citizenRoleId, karma).
+    """
+
     def __init__(self):
-        self.conn = sqlite3.connect("karmator.db", check_same_thread=False)
-        self.cursor = self.conn.cursor()
-
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS players (
-            regId INTEGER PRIMARY KEY AUTOINCREMENT,
-            discordId INTEGER NOT NULL UNIQUE,
-            mcNickname TEXT,
-            country TEXT,
-            isLeader BOOLEAN
-        )""")
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS countries (
-            countryId INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            citizenRoleId INTEGER NOT NULL UNIQUE,
-            karma INTEGER DEFAULT 0
-        )""")
-        self.conn.commit()
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, tuple] = {}
+        self._by_role: Dict[int, tuple] = {}
+        self._by_id: Dict[int, tuple] = {}
+
+    @staticmethod
+    def key(country_name: str) -> str:
+        return country_name.strip().casefold()
+
+    def load(self, rows: List[tuple]):
+        by_name: Dict[str, tuple] = {}
+        for row in rows:
+            other = by_name.setdefault(self.key(row[1]), row)
+            if other is not row:
+                # Такие страны различает только регистр: по названию
+                # находится первая, вторая доступна лишь по ID и роли
+                print(
+                    f"⚠️ Страны '{other[1]}' (ID {other[0]}) и '{row[1]}' (ID {row[0]}) "
+                    f"совпадают без учёта регистра, по названию находится '{other[1]}'"
+                )
+        with self._lock:
+            self._by_name = by_name
+            self._by_role = {row[2]: row for row in rows}
+            self._by_id = {row[0]: row for row in rows}
+
+    def put(self, row: tuple):
+        with self._lock:
+            self._put(row)
+
+    def _put(self, row: tuple):
+        self._by_name[self.key(row[1])] = row
+        self._by_role[row[2]] = row
+        self._by_id[row[0]] = row
+
+    def add_karma(self, country_name: str, quantity: int) -> Optional[tuple]:
+        with self._lock:
+            row = self._by_name.get(self.key(country_name))
+            if row is None:
+                return None
+            row = (row[0], row[1], row[2], row[3] + quantity)
+            self._put(row)
+            return row
+
+    def by_name(self, country_name: str) -> Optional[tuple]:
+        return self._by_name.get(self.key(country_name))
+
+    def by_role(self, citizen_role_id: int) -> Optional[tuple]:
+        return self._by_role.get(citizen_role_id)
+
+    def by_id(self, country_id: int) -> Optional[tuple]:
+        return self._by_id.get(country_id)
+
+    def all(self) -> List[tuple]:
+        return list(self._by_id.values())
+
+
+# ========== МИГРАЦИИ СХЕМЫ ==========
+def _migration_1_base_tables(conn: sqlite3.Connection):
+    """Исходные таблицы players и countries"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS players (
+        regId INTEGER PRIMARY KEY AUTOINCREMENT,
+        discordId INTEGER NOT NULL UNIQUE,
+        mcNickname TEXT,
+        country TEXT,
+        isLeader BOOLEAN
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS countries (
+        countryId INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE,
+        citizenRoleId INTEGER NOT NULL UNIQUE,
+        karma INTEGER DEFAULT 0
+    )""")
+
+
+def _migration_2_player_country_id(conn: sqlite3.Connection):
+    """Ссылка players.countryId на countries вместо сравнения названий"""
+    conn.execute(
+        "ALTER TABLE players ADD COLUMN countryId INTEGER "
+        "REFERENCES countries(countryId)"
+    )
+    # Сопоставляем через casefold: NOCASE в SQLite не понимает кириллицу
+    country_ids = {
+        CountryIndex.key(name): country_id
+        for country_id, name in conn.execute("SELECT countryId, name FROM countries")
+    }
+    for (country,) in conn.execute(
+        "SELECT DISTINCT country FROM players WHERE country IS NOT NULL"
+    ).fetchall():
+        country_id = country_ids.get(CountryIndex.key(country))
+        if country_id is not None:
+            conn.execute(
+                "UPDATE players SET countryId = ? WHERE country = ?",
+                (country_id, country),
+            )
+
+
+def _migration_3_indexes(conn: sqlite3.Connection):
+    """Индексы для поиска по названию страны, нику и стране игрока"""
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_countries_name_nocase "
+        "ON countries(name COLLATE NOCASE)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_players_mc_nickname ON players(mcNickname)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_players_country_id ON players(countryId)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_players_country ON players(country)")
+
+
+def _migration_4_karma_ledger(conn: sqlite3.Connection):
+    """Журнал изменений кармы и агрегаты по дням, неделям и месяцам"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS karma_ledger (
+        entryId INTEGER PRIMARY KEY AUTOINCREMENT,
+        countryId INTEGER NOT NULL REFERENCES countries(countryId),
+        delta INTEGER NOT NULL,
+        moderatorId INTEGER,
+        createdAt INTEGER NOT NULL
+    )""")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_karma_ledger_country "
+        "ON karma_ledger(countryId, createdAt)"
+    )
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS karma_buckets (
+        period TEXT NOT NULL,
+        bucketStart INTEGER NOT NULL,
+        countryId INTEGER NOT NULL REFERENCES countries(countryId),
+        karma INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (period, bucketStart, countryId)
+    )""")
+
+
+def _migration_5_applications(conn: sqlite3.Connection):
+    """Заявки на вайтлист, переживающие перезапуск бота"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS applications (
+        applicationId INTEGER PRIMARY KEY AUTOINCREMENT,
+        discordId INTEGER NOT NULL,
+        mcNickname TEXT NOT NULL,
+        country TEXT NOT NULL,
+        rules TEXT,
+        messageId INTEGER UNIQUE,
+        status TEXT NOT NULL DEFAULT 'pending',
+        createdAt INTEGER NOT NULL,
+        moderatorId INTEGER,
+        decidedAt INTEGER
+    )""")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_applications_status "
+        "ON applications(status, createdAt)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_applications_discord "
+        "ON applications(discordId)"
+    )
+
+
+def _migration_6_bot_state(conn: sqlite3.Connection):
+    """Служебные значения бота: хэш команд, ID сообщения регистрации"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""")
+
+
+def _migration_7_outbox(conn: sqlite3.Connection):
+    """Outbox побочных эффектов: RCON, роли и ЛС с повторами"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        outboxId INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        nextAttemptAt REAL NOT NULL,
+        lastError TEXT,
+        createdAt INTEGER NOT NULL
+    )""")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, nextAttemptAt)"
+    )
+
+
+# Порядковый номер миграции в списке — её версия (PRAGMA user_version)
+MIGRATIONS = [
+    _migration_1_base_tables,
+    _migration_2_player_country_id,
+    _migration_3_indexes,
+    _migration_4_karma_ledger,
+    _migration_5_applications,
+    _migration_6_bot_state,
+    _migration_7_outbox,
+]
 
-    def register_player(self, discord_id, mc_nickname, country):
-        try:
-            # Нормализуем название страны (приводим к нижнему регистру для поиска)
-            country_normalized = country.strip().lower()
 
-            # Ищем страну в БД (регистронезависимо)
-            self.cursor.execute(
-                "SELECT name, citizenRoleId FROM countries WHERE LOWER(name) = ?",
-                (country_normalized,),
+# Периоды рейтинга кармы и их подписи
+KARMA_PERIODS = {"day": "за сутки", "week": "за неделю", "month": "за месяц"}
+
+
+def karma_bucket_start(period: str, timestamp: int) -> int:
+    """Начало календарного периода (UTC), в который попадает timestamp"""
+    moment = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        start -= datetime.timedelta(days=start.weekday())
+    elif period == "month":
+        start = start.replace(day=1)
+    return int(start.timestamp())
+
+
+class KarmaBuffer:
+    """Изменения кармы, ещё не записанные в БД.
+
+    Каждая запись — строка будущего журнала:
+    (countryId, delta, moderatorId, createdAt).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: List[tuple] = []
+
+    @property
+    def changes(self) -> int:
+        return len(self._entries)
+
+    def add(self, country_id: int, quantity: int, moderator_id: Optional[int] = None):
+        with self._lock:
+            self._entries.append(
+                (country_id, quantity, moderator_id, int(time.time()))
             )
-            country_data = self.cursor.fetchone()
+
+    def take(self) -> List[tuple]:
+        with self._lock:
+            entries, self._entries = self._entries, []
+            return entries
+
+    def restore(self, entries: List[tuple]):
+        """Возвращает в буфер изменения, которые не удалось записать"""
+        with self._lock:
+            self._entries[:0] = entries
+
+    def snapshot(self) -> List[tuple]:
+        with self._lock:
+            return list(self._entries)
+
+
+class Database:
+    """Хранилище SQLite в режиме WAL.
+
+    Запись идёт через единственное соединение ``conn`` (им пользуется только
+    поток-писатель), чтение — через read-only соединения, по одному на поток.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL позволяет читателям работать параллельно с записью;
+        # при WAL synchronous=NORMAL не теряет целостность при сбое
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self._tune(self.conn)
+        self._migrate(self.conn)
+
+        self.karma_buffer = KarmaBuffer()
+        # Держится на время записи буфера, чтобы оконный рейтинг не видел
+        # одно и то же изменение и в БД, и в буфере
+        self._flush_lock = threading.Lock()
+        self.countries = CountryIndex()
+        self.countries.load(
+            self.conn.execute(
+                "SELECT countryId, name, citizenRoleId, karma FROM countries"
+            ).fetchall()
+        )
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Применяет недостающие миграции, каждую в своей транзакции"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS, 1):
+            if number <= version:
+                continue
+            conn.execute("BEGIN")
+            try:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            print(f"✅ БД: применена миграция {number} ({migration.__doc__})")
+
+    @staticmethod
+    def _tune(conn: sqlite3.Connection):
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+
+    def _reader(self) -> sqlite3.Connection:
+        """Read-only соединение текущего потока (у каждого читателя своё)"""
+        conn = getattr(self._local, "reader", None)
+        if conn is None:
+            uri = pathlib.Path(self.path).absolute().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._tune(conn)
+            self._local.reader = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @staticmethod
+    def _is_registered(conn: sqlite3.Connection, discord_id) -> bool:
+        return (
+            conn.execute("SELECT 1 FROM players WHERE discordId=?", (discord_id,))
+            .fetchone()
+            is not None
+        )
+
+    def register_player(self, discord_id, mc_nickname, country):
+        conn = self.conn
+        try:
+            # Ищем страну в индексе (регистронезависимо)
+            country_data = self.countries.by_name(country)
 
             if not country_data:
                 # Страна не найдена
                 return {"success": False, "error": "country_not_found"}
 
-            actual_country_name, citizen_role_id = country_data
+            country_id, actual_country_name, citizen_role_id, _ = country_data
 
             # Проверяем, не зарегистрирован ли уже пользователь
-            if self.check_player(discord_id):
+            if self._is_registered(conn, discord_id):
                 return {"success": False, "error": "already_registered"}
 
             # Регистрируем игрока
-            self.cursor.execute(
+            conn.execute(
                 """
-            INSERT INTO players (discordId, mcNickname, country, isLeader)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO players (discordId, mcNickname, country, isLeader, countryId)
+            VALUES (?, ?, ?, ?, ?)
             """,
-                (discord_id, mc_nickname, actual_country_name, False),
+                (discord_id, mc_nickname, actual_country_name, False, country_id),
             )
-            self.conn.commit()
+            conn.commit()
 
             return {
                 "success": True,
@@ -98,20 +943,21 @@ class Database:
         self, discord_id, mc_nickname, country_name
     ):
         """Регистрирует игрока, даже если страны нет в БД. Возвращает True при успехе."""
+        conn = self.conn
         try:
             # Проверяем, не зарегистрирован ли уже пользователь
-            if self.check_player(discord_id):
+            if self._is_registered(conn, discord_id):
                 return {"success": False, "error": "already_registered"}
 
             # Регистрируем игрока с указанной страной (даже если её нет в таблице countries)
-            self.cursor.execute(
+            conn.execute(
                 """
                 INSERT INTO players (discordId, mcNickname, country, isLeader)
                 VALUES (?, ?, ?, ?)
                 """,
                 (discord_id, mc_nickname, country_name, False),
             )
-            self.conn.commit()
+            conn.commit()
             return {"success": True, "country": country_name}
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint failed" in str(e):
@@ -121,31 +967,59 @@ class Database:
             return {"success": False, "error": str(e)}
 
     def check_player(self, discord_id):
-        self.cursor.execute(
-            "SELECT * FROM players WHERE discordId=?",
-            (discord_id,),
-        )
-        return self.cursor.fetchone() is not None
+        return self._is_registered(self._reader(), discord_id)
 
     def get_player(self, discord_id):
-        self.cursor.execute(
-            "SELECT * FROM players WHERE discordId=?",
-            (discord_id,),
+        return (
+            self._reader()
+            .execute(
+                "SELECT regId, discordId, mcNickname, country, isLeader "
+                "FROM players WHERE discordId=?",
+                (discord_id,),
+            )
+            .fetchone()
         )
-        return self.cursor.fetchone()
+
+    def get_all_players(self) -> List[tuple]:
+        """Все игроки: (discordId, mcNickname, country, isLeader) в порядке регистрации"""
+        return self._reader().execute(
+            "SELECT discordId, mcNickname, country, isLeader FROM players ORDER BY regId"
+        ).fetchall()
+
+    def get_player_nicknames(self) -> List[str]:
+        """Ники Minecraft всех зарегистрированных игроков"""
+        return [
+            row[0]
+            for row in self._reader().execute(
+                "SELECT mcNickname FROM players WHERE mcNickname IS NOT NULL"
+            )
+        ]
+
+    def get_nicknames_awaiting_role(self, role_id: int) -> List[str]:
+        """Ники игроков, чья выдача роли role_id ещё в outbox (ждёт повтора или упала)"""
+        return [
+            row[0]
+            for row in self._reader().execute(
+                "SELECT mcNickname FROM players WHERE mcNickname IS NOT NULL "
+                "AND discordId IN (SELECT json_extract(payload, '$.user_id') "
+                "FROM outbox WHERE kind = 'add_role' "
+                "AND json_extract(payload, '$.role_id') = ?)",
+                (role_id,),
+            )
+        ]
 
     def toggle_player_leader(self, discord_id):
-        self.cursor.execute(
+        conn = self.conn
+        result = conn.execute(
             "SELECT isLeader, country FROM players WHERE discordId = ?", (discord_id,)
-        )
-        result = self.cursor.fetchone()
+        ).fetchone()
         if result:
             is_leader, country = result
-            self.cursor.execute(
+            conn.execute(
                 "UPDATE players SET isLeader = ? WHERE discordId = ?",
                 (not bool(is_leader), discord_id),
             )
-            self.conn.commit()
+            conn.commit()
             return {
                 "success": True,
                 "old_status": bool(is_leader),
@@ -155,108 +1029,1183 @@ class Database:
         return {"success": False}
 
     def change_player_nickname(self, discord_id, new_nickname):
+        conn = self.conn
         try:
-            self.cursor.execute(
+            conn.execute(
                 "UPDATE players SET mcNickname = ? WHERE discordId = ?",
                 (new_nickname, discord_id),
             )
-            self.conn.commit()
+            conn.commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
     def create_country(self, country_name: str, citizen_role_id: int) -> bool:
+        # Названия, отличающиеся только регистром, считаются одной страной
+        if self.countries.by_name(country_name):
+            return False
+        conn = self.conn
         try:
-            self.cursor.execute(
+            cursor = conn.execute(
                 "INSERT INTO countries (name, citizenRoleId) VALUES (?, ?)",
                 (country_name, citizen_role_id),
             )
-            self.conn.commit()
-            return True
+            country_id = cursor.lastrowid
+            # Привязываем игроков, зарегистрированных до создания страны
+            for (country,) in conn.execute(
+                "SELECT DISTINCT country FROM players WHERE countryId IS NULL"
+            ).fetchall():
+                if country and CountryIndex.key(country) == CountryIndex.key(
+                    country_name
+                ):
+                    conn.execute(
+                        "UPDATE players SET countryId = ? "
+                        "WHERE countryId IS NULL AND country = ?",
+                        (country_id, country),
+                    )
+            conn.commit()
         except sqlite3.IntegrityError:
+            conn.rollback()
             return False
+        self.countries.put((country_id, country_name, citizen_role_id, 0))
+        return True
 
     def get_country_by_role(self, citizen_role_id: int):
-        self.cursor.execute(
-            "SELECT * FROM countries WHERE citizenRoleId = ?", (citizen_role_id,)
-        )
-        return self.cursor.fetchone()
+        return self.countries.by_role(citizen_role_id)
 
     def get_country_by_name(self, country_name: str):
-        self.cursor.execute(
-            "SELECT * FROM countries WHERE LOWER(name) = ?", (country_name.lower(),)
-        )
-        return self.cursor.fetchone()
+        return self.countries.by_name(country_name)
 
     def get_all_countries(self) -> List[tuple]:
-        self.cursor.execute("SELECT * FROM countries ORDER BY karma DESC")
-        return self.cursor.fetchall()
+        return sorted(self.countries.all(), key=lambda row: (-row[3], row[0]))
 
-    def modify_karma_value(self, country_name: str, quantity: int) -> bool:
-        try:
-            # Находим страну (регистронезависимо)
-            self.cursor.execute(
-                "SELECT name FROM countries WHERE LOWER(name) = ?",
-                (country_name.lower(),),
-            )
-            country = self.cursor.fetchone()
+    def modify_karma_value(
+        self, country_name: str, quantity: int, moderator_id: Optional[int] = None
+    ) -> bool:
+        """Меняет карму в индексе сразу, а в БД — при следующем flush_karma"""
+        # Находим страну (регистронезависимо)
+        country = self.countries.add_karma(country_name, quantity)
 
-            if not country:
-                return False
+        if not country:
+            return False
+
+        self.karma_buffer.add(country[0], quantity, moderator_id)
+        return True
 
-            actual_country_name = country[0]
+    def flush_karma(self) -> int:
+        """Записывает накопленные изменения кармы, журнал и агрегаты одной транзакцией"""
+        with self._flush_lock:
+            entries = self.karma_buffer.take()
+            if not entries:
+                return 0
 
-            self.cursor.execute(
-                "UPDATE countries SET karma = karma + ? WHERE name = ?",
-                (quantity, actual_country_name),
+            totals: Dict[int, int] = {}
+            buckets: Dict[tuple, int] = {}
+            for country_id, delta, _, created_at in entries:
+                totals[country_id] = totals.get(country_id, 0) + delta
+                for period in KARMA_PERIODS:
+                    key = (period, karma_bucket_start(period, created_at), country_id)
+                    buckets[key] = buckets.get(key, 0) + delta
+
+            try:
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE countries SET karma = karma + ? WHERE countryId = ?",
+                        [(delta, country_id) for country_id, delta in totals.items()],
+                    )
+                    self.conn.executemany(
+                        "INSERT INTO karma_ledger "
+                        "(countryId, delta, moderatorId, createdAt) VALUES (?, ?, ?, ?)",
+                        entries,
+                    )
+                    self.conn.executemany(
+                        """
+                        INSERT INTO karma_buckets (period, bucketStart, countryId, karma)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (period, bucketStart, countryId)
+                        DO UPDATE SET karma = karma + excluded.karma
+                        """,
+                        [key + (delta,) for key, delta in buckets.items()],
+                    )
+            except Exception:
+                self.karma_buffer.restore(entries)
+                raise
+            return len(entries)
+
+    def get_karma_leaderboard(self, period: str) -> List[tuple]:
+        """Рейтинг стран по карме за текущий день, неделю или месяц"""
+        bucket = karma_bucket_start(period, int(time.time()))
+        with self._flush_lock:
+            totals = dict(
+                self._reader().execute(
+                    "SELECT countryId, karma FROM karma_buckets "
+                    "WHERE period = ? AND bucketStart = ?",
+                    (period, bucket),
+                )
             )
-            self.conn.commit()
-            return True
-        except Exception:
-            return False
+            pending = self.karma_buffer.snapshot()
+        for country_id, delta, _, created_at in pending:
+            if karma_bucket_start(period, created_at) == bucket:
+                totals[country_id] = totals.get(country_id, 0) + delta
+        rows = [
+            (country_id, name, role_id, totals.get(country_id, 0))
+            for country_id, name, role_id, _ in self.countries.all()
+        ]
+        return sorted(rows, key=lambda row: (-row[3], row[0]))
 
     def get_country_karma(self, country_name: str) -> Optional[int]:
-        try:
-            self.cursor.execute(
-                "SELECT karma FROM countries WHERE LOWER(name) = ?",
-                (country_name.lower(),),
-            )
-            result = self.cursor.fetchone()
-            return result[0] if result else None
-        except Exception:
-            return None
+        country = self.countries.by_name(country_name)
+        return country[3] if country else None
 
     def get_country_stats(self):
         """Получает статистику всех стран"""
-        self.cursor.execute("""
-            SELECT c.name, c.karma, COUNT(p.discordId) as citizens_count
+        citizens = self._reader().execute("""
+            SELECT c.countryId, COUNT(p.discordId) as citizens_count
             FROM countries c
-            LEFT JOIN players p ON c.name = p.country
-            GROUP BY c.name
-            ORDER BY c.karma DESC
+            LEFT JOIN players p ON p.countryId = c.countryId
+            GROUP BY c.countryId
         """)
-        return self.cursor.fetchall()
+        # Карму берём из индекса: в нём учтены ещё не записанные изменения
+        stats = []
+        for country_id, citizens_count in citizens:
+            country = self.countries.by_id(country_id)
+            if country:
+                stats.append((country_id, country[1], country[3], citizens_count))
+        stats.sort(key=lambda row: (-row[2], row[0]))
+        return [row[1:] for row in stats]
+
+    # ---------- Заявки ----------
+    _APPLICATION_COLUMNS = (
+        "applicationId, discordId, mcNickname, country, rules, messageId, status"
+    )
+
+    @staticmethod
+    def _application(row) -> Optional[dict]:
+        if row is None:
+            return None
+        application_id, discord_id, mc_nickname, country, rules, message_id, status = row
+        return {
+            "id": application_id,
+            "discord_id": discord_id,
+            "minecraft": mc_nickname,
+            "country": country,
+            "rules": rules,
+            "message_id": message_id,
+            "status": status,
+        }
+
+    def create_application(self, discord_id, mc_nickname, country, rules) -> int:
+        with self.conn:
+            cursor = self.conn.execute(
+                """
+                INSERT INTO applications (discordId, mcNickname, country, rules, createdAt)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (discord_id, mc_nickname, country, rules, int(time.time())),
+            )
+        return cursor.lastrowid
+
+    def set_application_message(self, application_id: int, message_id: int):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE applications SET messageId = ? WHERE applicationId = ?",
+                (message_id, application_id),
+            )
+
+    def delete_application(self, application_id: int):
+        """Удаляет заявку, так и не опубликованную в канале модерации"""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM applications WHERE applicationId = ? AND messageId IS NULL",
+                (application_id,),
+            )
+
+    def get_application_by_message(self, message_id: int) -> Optional[dict]:
+        return self._application(
+            self._reader()
+            .execute(
+                f"SELECT {self._APPLICATION_COLUMNS} FROM applications "
+                "WHERE messageId = ?",
+                (message_id,),
+            )
+            .fetchone()
+        )
+
+    def resolve_application(
+        self, application_id: int, status: str, moderator_id: int, effects=()
+    ) -> bool:
+        """Закрывает заявку, если она ещё ожидает решения. False — уже закрыта.
+
+        ``effects`` — записи outbox (вид, данные), добавляемые той же транзакцией.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                """
+                UPDATE applications SET status = ?, moderatorId = ?, decidedAt = ?
+                WHERE applicationId = ? AND status = 'pending'
+                """,
+                (status, moderator_id, int(time.time()), application_id),
+            )
+            if cursor.rowcount == 1:
+                self._enqueue(effects)
+        return cursor.rowcount == 1
+
+    def get_pending_applications(
+        self, message_ids: Optional[List[int]] = None
+    ) -> List[dict]:
+        """Ожидающие заявки: все или только с указанными ID сообщений.
+
+        Заявки без сообщения в канале модерации не видны модераторам и не
+        возвращаются.
+        """
+        query = f"SELECT {self._APPLICATION_COLUMNS} FROM applications "
+        if message_ids:
+            placeholders = ", ".join("?" * len(message_ids))
+            rows = self._reader().execute(
+                query + f"WHERE status = 'pending' AND messageId IN ({placeholders}) "
+                "ORDER BY createdAt",
+                message_ids,
+            )
+        else:
+            rows = self._reader().execute(
+                query + "WHERE status = 'pending' AND messageId IS NOT NULL "
+                "ORDER BY createdAt"
+            )
+        return [self._application(row) for row in rows]
+
+    # ---------- Состояние бота ----------
+    def get_state(self, key: str) -> Optional[str]:
+        row = self._reader().execute(
+            "SELECT value FROM bot_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO bot_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def ping(self):
+        """Проверяет, что БД доступна на запись: берёт и сразу отпускает блокировку"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("ROLLBACK")
+
+    def count_pending_applications(self) -> int:
+        (count,) = self._reader().execute(
+            "SELECT COUNT(*) FROM applications "
+            "WHERE status = 'pending' AND messageId IS NOT NULL"
+        ).fetchone()
+        return count
+
+    def accept_applications(
+        self,
+        applications: List[dict],
+        moderator_id: int,
+        effects: Optional[Callable[[dict, dict], list]] = None,
+        lease: float = 0.0,
+    ):
+        """Регистрирует игроков по заявкам и закрывает заявки одной транзакцией.
+
+        Возвращает результаты в формате register_player, по одному на заявку.
+        Если страны нет в БД, игрок регистрируется без неё. ``effects(заявка,
+        результат)`` возвращает записи outbox для каждого принятого игрока;
+        добавленные записи попадают в результат под ключом ``outbox``
+        (``lease`` — см. _enqueue).
+        """
+        results = []
+        now = int(time.time())
+        with self.conn:
+            for application in applications:
+                discord_id = application["discord_id"]
+                if self._is_registered(self.conn, discord_id):
+                    results.append({"success": False, "error": "already_registered"})
+                    continue
+
+                # Заявку мог закрыть другой модератор, пока искали участника
+                cursor = self.conn.execute(
+                    """
+                    UPDATE applications SET status = 'accepted', moderatorId = ?, decidedAt = ?
+                    WHERE applicationId = ? AND status = 'pending'
+                    """,
+                    (moderator_id, now, application["id"]),
+                )
+                if cursor.rowcount == 0:
+                    results.append({"success": False, "error": "already_resolved"})
+                    continue
+
+                result = {"success": True, "country": application["country"]}
+                country_id = None
+                country = self.countries.by_name(application["country"])
+                if country:
+                    country_id, result["country"], result["citizen_role_id"], _ = country
+
+                self.conn.execute(
+                    """
+                    INSERT INTO players (discordId, mcNickname, country, isLeader, countryId)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (
+                        discord_id,
+                        application["minecraft"],
+                        result["country"],
+                        False,
+                        country_id,
+                    ),
+                )
+                if effects is not None:
+                    result["outbox"] = self._enqueue(effects(application, result), lease)
+                results.append(result)
+        return results
+
+    def resolve_applications(
+        self,
+        application_ids: List[int],
+        status: str,
+        moderator_id: int,
+        effects: Optional[Dict[int, list]] = None,
+    ) -> List[int]:
+        """Закрывает заявки одной транзакцией; возвращает ID тех, что ещё ожидали решения.
+
+        ``effects`` — записи outbox по ID заявки, добавляются только для закрытых.
+        """
+        resolved = []
+        now = int(time.time())
+        with self.conn:
+            for application_id in application_ids:
+                cursor = self.conn.execute(
+                    """
+                    UPDATE applications SET status = ?, moderatorId = ?, decidedAt = ?
+                    WHERE applicationId = ? AND status = 'pending'
+                    """,
+                    (status, moderator_id, now, application_id),
+                )
+                if cursor.rowcount == 1:
+                    resolved.append(application_id)
+                    if effects:
+                        self._enqueue(effects.get(application_id, ()))
+        return resolved
+
+    # ---------- Outbox ----------
+    def _enqueue(self, effects, delay: float = 0.0) -> List[tuple]:
+        """Добавляет записи outbox в текущую транзакцию писателя.
+
+        ``delay`` откладывает первую попытку фонового обработчика — на это
+        время записи остаются за тем, кто выполняет их сразу. Возвращает
+        добавленные записи: (outboxId, kind, payload).
+        """
+        now = time.time()
+        entries = []
+        for kind, payload in effects:
+            cursor = self.conn.execute(
+                "INSERT INTO outbox (kind, payload, nextAttemptAt, createdAt) "
+                "VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False), now + delay, int(now)),
+            )
+            entries.append((cursor.lastrowid, kind, payload))
+        return entries
+
+    def get_due_outbox(self, limit: int) -> List[tuple]:
+        """Записи, которые пора выполнить: (outboxId, kind, payload, attempts)"""
+        rows = self._reader().execute(
+            "SELECT outboxId, kind, payload, attempts FROM outbox "
+            "WHERE status = 'pending' AND nextAttemptAt <= ? "
+            "ORDER BY nextAttemptAt LIMIT ?",
+            (time.time(), limit),
+        )
+        return [
+            (outbox_id, kind, json.loads(payload), attempts)
+            for outbox_id, kind, payload, attempts in rows
+        ]
+
+    def complete_outbox(
+        self,
+        done: List[int],
+        retry: List[Tuple[int, float, str]],
+        failed: List[Tuple[int, str]],
+        follow_ups=(),
+    ):
+        """Итоги прохода одной транзакцией: выполненные удаляются, остальные
+        откладываются до nextAttemptAt или помечаются failed. ``follow_ups`` —
+        записи, зависевшие от выполненных"""
+        with self.conn:
+            self._enqueue(follow_ups)
+            self.conn.executemany(
+                "DELETE FROM outbox WHERE outboxId = ?", [(i,) for i in done]
+            )
+            self.conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, nextAttemptAt = ?, "
+                "lastError = ? WHERE outboxId = ?",
+                [(next_at, error, i) for i, next_at, error in retry],
+            )
+            self.conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, status = 'failed', "
+                "lastError = ? WHERE outboxId = ?",
+                [(error, i) for i, error in failed],
+            )
+
+    def get_outbox_stats(self) -> Dict[str, int]:
+        stats = {"pending": 0, "failed": 0}
+        stats.update(
+            self._reader().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+        )
+        return stats
+
+    def close(self):
+        """Закрывает соединения читателей и писателя"""
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self.conn.close()
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.close()
+        self.close()
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к Database без блокировки event loop.
+
+    Все записи выполняются в единственном потоке-писателе (очередь запросов
+    ThreadPoolExecutor), чтения — в пуле потоков-читателей. У каждого потока
+    своё соединение с SQLite.
+    """
+
+    def __init__(self, db: Database, readers: int = DB_READERS):
+        self.db = db
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-writer"
+        )
+        self._readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader"
+        )
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self._closed = False
+        # Вызываются после изменений стран, кармы и игроков (рейтинги, JSON API)
+        self.on_change: List[Callable[[], None]] = []
+
+    def _changed(self):
+        for callback in self.on_change:
+            callback()
+
+    async def _run(self, executor, op: str, func, *args):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(func, *args))
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, op, func.__name__)
+
+    async def _read(self, func, *args):
+        return await self._run(self._readers, "read", func, *args)
+
+    async def _write(self, func, *args):
+        return await self._run(self._writer, "write", func, *args)
+
+    # ---------- Игроки ----------
+    async def register_player(self, discord_id, mc_nickname, country):
+        result = await self._write(
+            self.db.register_player, discord_id, mc_nickname, country
+        )
+        if result["success"]:
+            self._changed()
+        return result
+
+    async def register_player_without_country_check(
+        self, discord_id, mc_nickname, country_name
+    ):
+        result = await self._write(
+            self.db.register_player_without_country_check,
+            discord_id,
+            mc_nickname,
+            country_name,
+        )
+        if result["success"]:
+            self._changed()
+        return result
+
+    async def check_player(self, discord_id):
+        return await self._read(self.db.check_player, discord_id)
+
+    async def get_player(self, discord_id):
+        return await self._read(self.db.get_player, discord_id)
+
+    async def get_all_players(self) -> List[tuple]:
+        return await self._read(self.db.get_all_players)
+
+    async def get_player_nicknames(self) -> List[str]:
+        return await self._read(self.db.get_player_nicknames)
+
+    async def get_nicknames_awaiting_role(self, role_id: int) -> List[str]:
+        return await self._read(self.db.get_nicknames_awaiting_role, role_id)
+
+    async def toggle_player_leader(self, discord_id):
+        result = await self._write(self.db.toggle_player_leader, discord_id)
+        if result["success"]:
+            self._changed()
+        return result
+
+    async def change_player_nickname(self, discord_id, new_nickname):
+        result = await self._write(
+            self.db.change_player_nickname, discord_id, new_nickname
+        )
+        if result:
+            self._changed()
+        return result
+
+    # ---------- Страны ----------
+    async def create_country(self, country_name: str, citizen_role_id: int) -> bool:
+        result = await self._write(
+            self.db.create_country, country_name, citizen_role_id
+        )
+        if result:
+            self._changed()
+        return result
+
+    # Поиск стран отвечает из индекса в памяти, без похода в поток БД
+    async def get_country_by_role(self, citizen_role_id: int):
+        return self.db.get_country_by_role(citizen_role_id)
+
+    async def get_country_by_name(self, country_name: str):
+        return self.db.get_country_by_name(country_name)
+
+    async def get_all_countries(self) -> List[tuple]:
+        return self.db.get_all_countries()
+
+    async def modify_karma_value(
+        self, country_name: str, quantity: int, moderator_id: Optional[int] = None
+    ) -> bool:
+        result = self.db.modify_karma_value(country_name, quantity, moderator_id)
+        if result:
+            self._changed()
+        if result and self.db.karma_buffer.changes >= KARMA_FLUSH_THRESHOLD:
+            if self._flushing is None or self._flushing.done():
+                self._flushing = asyncio.create_task(
+                    watch_steps("karma:flush", self.flush_karma())
+                )
+        return result
+
+    async def flush_karma(self) -> int:
+        return await self._write(self.db.flush_karma)
+
+    async def get_country_karma(self, country_name: str) -> Optional[int]:
+        return self.db.get_country_karma(country_name)
+
+    async def get_karma_leaderboard(self, period: str) -> List[tuple]:
+        return await self._read(self.db.get_karma_leaderboard, period)
+
+    async def get_country_stats(self):
+        return await self._read(self.db.get_country_stats)
+
+    async def _flush_karma_periodically(self):
+        while True:
+            await asyncio.sleep(KARMA_FLUSH_INTERVAL)
+            try:
+                await watch_steps("karma:flush", self.flush_karma())
+            except Exception as e:
+                print(f"⚠️ Ошибка записи кармы в БД: {e}")
+
+    # ---------- Заявки ----------
+    async def create_application(self, discord_id, mc_nickname, country, rules) -> int:
+        return await self._write(
+            self.db.create_application, discord_id, mc_nickname, country, rules
+        )
+
+    async def set_application_message(self, application_id: int, message_id: int):
+        return await self._write(
+            self.db.set_application_message, application_id, message_id
+        )
+
+    async def delete_application(self, application_id: int):
+        await self._write(self.db.delete_application, application_id)
+
+    async def get_application_by_message(self, message_id: int) -> Optional[dict]:
+        return await self._read(self.db.get_application_by_message, message_id)
+
+    async def resolve_application(
+        self, application_id: int, status: str, moderator_id: int, effects=()
+    ) -> bool:
+        return await self._write(
+            self.db.resolve_application, application_id, status, moderator_id, effects
+        )
+
+    async def get_pending_applications(
+        self, message_ids: Optional[List[int]] = None
+    ) -> List[dict]:
+        return await self._read(self.db.get_pending_applications, message_ids)
+
+    async def get_state(self, key: str) -> Optional[str]:
+        return await self._read(self.db.get_state, key)
+
+    async def set_state(self, key: str, value: str):
+        await self._write(self.db.set_state, key, value)
+
+    async def ping(self):
+        await self._write(self.db.ping)
+
+    async def count_pending_applications(self) -> int:
+        return await self._read(self.db.count_pending_applications)
+
+    async def accept_applications(
+        self,
+        applications: List[dict],
+        moderator_id: int,
+        effects: Optional[Callable[[dict, dict], list]] = None,
+        lease: float = 0.0,
+    ):
+        results = await self._write(
+            self.db.accept_applications, applications, moderator_id, effects, lease
+        )
+        if any(result["success"] for result in results):
+            self._changed()
+        return results
+
+    async def resolve_applications(
+        self,
+        application_ids: List[int],
+        status: str,
+        moderator_id: int,
+        effects: Optional[Dict[int, list]] = None,
+    ) -> List[int]:
+        return await self._write(
+            self.db.resolve_applications, application_ids, status, moderator_id, effects
+        )
+
+    async def get_due_outbox(self, limit: int) -> List[tuple]:
+        return await self._read(self.db.get_due_outbox, limit)
+
+    async def complete_outbox(self, done, retry, failed, follow_ups=()):
+        await self._write(self.db.complete_outbox, done, retry, failed, follow_ups)
+
+    async def get_outbox_stats(self) -> Dict[str, int]:
+        return await self._read(self.db.get_outbox_stats)
+
+    def start(self):
+        """Запускает фоновую запись буфера кармы"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_karma_periodically())
+
+    def close(self):
+        """Дожидается завершения запросов, сбрасывает буфер кармы и закрывает соединения"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.db.flush_karma()
+        self.db.close()
+
+
+# ========== RCON ==========
+RCON_TYPE_RESPONSE = 0  # SERVERDATA_RESPONSE_VALUE
+RCON_TYPE_EXEC = 2  # SERVERDATA_EXECCOMMAND
+RCON_TYPE_AUTH_RESPONSE = 2  # SERVERDATA_AUTH_RESPONSE
+RCON_TYPE_AUTH = 3  # SERVERDATA_AUTH
+RCON_FRAGMENT_SIZE = 4096  # Ответы длиннее разбиваются сервером на пакеты
+
+
+class RconError(Exception):
+    """Ошибка протокола RCON"""
+
+
+class RconAuthError(RconError):
+    """Сервер отклонил пароль RCON"""
+
+
+class RconUnavailableError(RconError):
+    """RCON отключён предохранителем после серии ошибок"""
+
+
+class _RconRequest:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.fragments: List[bytes] = []
+        self.sentinel_id: Optional[int] = None
+        self.sent_at = time.perf_counter()
 
 
-# Вместо этого используйте этот простой код:
-async def execute_rcon_command(command: str) -> str:
-    """Самая простая рабочая версия"""
+class RconConnection:
+    """Асинхронное соединение по протоколу Source RCON.
+
+    Ответы сопоставляются с запросами по request ID, поэтому на одном сокете
+    может выполняться до ``depth`` команд одновременно. Многопакетные ответы
+    собираются целиком: после фрагмента максимальной длины отправляется
+    пустой пакет-маркер, и ответ считается полным, когда сервер его вернёт.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: Optional[str],
+        *,
+        timeout: float = RCON_TIMEOUT,
+        depth: int = RCON_PIPELINE_DEPTH,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.depth = depth
+        self.last_used = time.monotonic()
+        # Время последнего полученного ответа (не просто отправленной команды)
+        self.last_success: Optional[float] = None
+        self.in_flight = 0
+        self._slots = asyncio.Semaphore(depth)
+        self._connect_lock = asyncio.Lock()
+        self._ids = itertools.count()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._auth: Optional[Tuple[int, asyncio.Future]] = None
+        self._requests: Dict[int, _RconRequest] = {}
+        self._sentinels: Dict[int, int] = {}
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    def _next_id(self) -> int:
+        # ID должен быть положительным int32: -1 сервер использует для отказа
+        return next(self._ids) % 0x7FFFFFFF + 1
+
+    def _send(self, request_id: int, packet_type: int, body: str = ""):
+        payload = body.encode("utf-8")
+        self._writer.write(
+            struct.pack("<iii", len(payload) + 10, request_id, packet_type)
+            + payload
+            + b"\x00\x00"
+        )
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self.connected:
+                return
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+            self._read_task = asyncio.create_task(self._read_loop())
+            try:
+                await self._login()
+            except BaseException:
+                await self.close()
+                raise
+            self.last_used = time.monotonic()
+
+    async def _login(self):
+        auth_id = self._next_id()
+        future = asyncio.get_running_loop().create_future()
+        self._auth = (auth_id, future)
+        self._send(auth_id, RCON_TYPE_AUTH, self.password or "")
+        await self._writer.drain()
+        try:
+            if not await asyncio.wait_for(future, self.timeout):
+                raise RconAuthError("Неверный пароль RCON")
+        finally:
+            self._auth = None
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(4)
+                (length,) = struct.unpack("<i", header)
+                data = await self._reader.readexactly(length)
+                request_id, packet_type = struct.unpack("<ii", data[:8])
+                self._on_packet(request_id, packet_type, data[8:-2])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self._writer is not None:
+                self._writer.close()
+            self._fail_all(
+                ConnectionError(f"RCON-соединение закрыто: {type(e).__name__}")
+            )
+
+    def _on_packet(self, request_id: int, packet_type: int, body: bytes):
+        if self._auth is not None and packet_type == RCON_TYPE_AUTH_RESPONSE:
+            auth_id, future = self._auth
+            if not future.done() and request_id in (auth_id, -1):
+                future.set_result(request_id == auth_id)
+            return
+
+        request = self._requests.get(request_id)
+        if request is not None:
+            request.fragments.append(body)
+            if request.sentinel_id is None:
+                if len(body) < RCON_FRAGMENT_SIZE:
+                    self._finish(request_id)
+                else:
+                    # Ответ может продолжаться — просим сервер отметить его конец
+                    request.sentinel_id = self._next_id()
+                    self._sentinels[request.sentinel_id] = request_id
+                    self._send(request.sentinel_id, RCON_TYPE_RESPONSE)
+            return
+
+        owner_id = self._sentinels.pop(request_id, None)
+        if owner_id is not None:
+            self._finish(owner_id)
+        # Ответы на запросы, отменённые по таймауту, просто отбрасываются
+
+    def _finish(self, request_id: int):
+        request = self._requests.pop(request_id)
+        if request.sentinel_id is not None:
+            self._sentinels.pop(request.sentinel_id, None)
+        if not request.future.done():
+            RCON_RTT_SECONDS.observe(time.perf_counter() - request.sent_at)
+            self.last_success = time.monotonic()
+            request.future.set_result(
+                b"".join(request.fragments).decode("utf-8", errors="replace")
+            )
+
+    def _fail_all(self, error: Exception):
+        requests = list(self._requests.values())
+        self._requests.clear()
+        self._sentinels.clear()
+        for request in requests:
+            if not request.future.done():
+                request.future.set_exception(error)
+        if self._auth is not None and not self._auth[1].done():
+            self._auth[1].set_exception(error)
+
+    async def run(self, command: str, timeout: Optional[float] = None) -> str:
+        """Выполняет команду и возвращает полный ответ сервера"""
+        (result,) = await self.run_many([command], timeout)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    async def run_many(
+        self, commands: List[str], timeout: Optional[float] = None
+    ) -> List[Union[str, BaseException]]:
+        """Выполняет команды пачками по ``depth`` штук, каждая пачка — одна запись в сокет.
+
+        Возвращает ответы в порядке команд; неудавшаяся команда представлена
+        своим исключением. Ошибка подключения пробрасывается целиком.
+        """
+        results: List[Union[str, BaseException]] = []
+        for start in range(0, len(commands), self.depth):
+            chunk = commands[start : start + self.depth]
+            results.extend(await self._run_chunk(chunk, timeout or self.timeout))
+        return results
+
+    async def _run_chunk(self, commands: List[str], timeout: float):
+        acquired = 0
+        try:
+            for _ in commands:
+                await self._slots.acquire()
+                acquired += 1
+                self.in_flight += 1
+            if not self.connected:
+                await self.connect()
+
+            requests: Dict[int, _RconRequest] = {}
+            loop = asyncio.get_running_loop()
+            try:
+                for command in commands:
+                    request_id = self._next_id()
+                    requests[request_id] = _RconRequest(loop.create_future())
+                    self._requests[request_id] = requests[request_id]
+                    self._send(request_id, RCON_TYPE_EXEC, command)
+                await self._writer.drain()
+                futures = [request.future for request in requests.values()]
+                await asyncio.wait(futures, timeout=timeout)
+            finally:
+                for request_id, request in requests.items():
+                    if self._requests.pop(request_id, None) is request:
+                        if request.sentinel_id is not None:
+                            self._sentinels.pop(request.sentinel_id, None)
+
+            results: List[Union[str, BaseException]] = []
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+                    results.append(asyncio.TimeoutError("RCON не ответил вовремя"))
+                else:
+                    results.append(future.exception() or future.result())
+            self.last_used = time.monotonic()
+            return results
+        finally:
+            self.in_flight -= acquired
+            for _ in range(acquired):
+                self._slots.release()
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (OSError, asyncio.CancelledError):
+                pass
+            self._writer = None
+            self._reader = None
+        self._fail_all(ConnectionError("RCON-соединение закрыто"))
+
+
+class RconPool:
+    """Пул постоянных RCON-соединений с ограничением параллельности и keepalive"""
+
+    def __init__(self, size: int = RCON_POOL_SIZE, depth: int = RCON_PIPELINE_DEPTH):
+        self.connections = [
+            RconConnection(RCON_HOST, RCON_PORT, RCON_PASSWORD, depth=depth)
+            for _ in range(size)
+        ]
+        self._capacity = asyncio.Semaphore(size * depth)
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    async def run(self, command: str) -> str:
+        async with self._capacity:
+            # Берём наименее загруженное соединение
+            connection = min(self.connections, key=lambda c: c.in_flight)
+            try:
+                return await connection.run(command)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Сокет умер или сервер перезапустился — переподключаемся один раз
+                await connection.close()
+                return await connection.run(command)
+
+    async def run_batch(self, commands: List[str]) -> List[Union[str, BaseException]]:
+        """Делит пачку команд между соединениями и выполняет части параллельно"""
+        step = -(-len(commands) // len(self.connections))
+        chunks = [
+            (connection, commands[start : start + step])
+            for connection, start in zip(self.connections, range(0, len(commands), step))
+        ]
+
+        async def run_chunk(connection: RconConnection, chunk: List[str]):
+            try:
+                try:
+                    results = await connection.run_many(chunk)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    await connection.close()
+                    return await connection.run_many(chunk)
+            except Exception as e:
+                return [e] * len(chunk)
+            # Сокет умер посреди пачки — как и в run, повторяем один раз
+            # только команды, оставшиеся без ответа
+            lost = [
+                i
+                for i, result in enumerate(results)
+                if isinstance(result, (ConnectionError, asyncio.IncompleteReadError))
+            ]
+            if lost:
+                try:
+                    await connection.close()
+                    retried = await connection.run_many([chunk[i] for i in lost])
+                except Exception as e:
+                    retried = [e] * len(lost)
+                for i, result in zip(lost, retried):
+                    results[i] = result
+            return results
+
+        results = await asyncio.gather(*(run_chunk(c, chunk) for c, chunk in chunks))
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def _keepalive(self):
+        """Проверяет простаивающие соединения, чтобы сервер не закрыл их по таймауту"""
+        while True:
+            await asyncio.sleep(RCON_KEEPALIVE_INTERVAL)
+            for connection in self.connections:
+                idle_for = time.monotonic() - connection.last_used
+                if not connection.connected or idle_for < RCON_KEEPALIVE_INTERVAL:
+                    continue
+                try:
+                    await connection.run("list")
+                except Exception as e:
+                    RCON_ERRORS.inc(type(e).__name__)
+                    print(f"⚠️ RCON keepalive: {type(e).__name__}: {e}")
+                    await connection.close()
+
+    def start(self):
+        if self._keepalive_task is None:
+            self._keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        for connection in self.connections:
+            await connection.close()
+
+
+class CircuitBreaker:
+    """Предохранитель: после ``failures`` ошибок подряд размыкается.
+
+    В разомкнутом состоянии вызовы сразу получают отказ, не дожидаясь
+    таймаута. Через ``reset_timeout`` секунд пропускается одна пробная
+    попытка (half-open): успех замыкает цепь, ошибка снова размыкает её.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        failures: int = RCON_BREAKER_FAILURES,
+        reset_timeout: float = RCON_BREAKER_RESET,
+    ):
+        self.max_failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов; в half-open пропускает одну пробу за раз"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            print("✅ RCON снова доступен, предохранитель замкнут")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self, error: BaseException):
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.max_failures:
+            if self.state != self.OPEN:
+                print(f"⚠️ RCON недоступен, предохранитель разомкнут: {self.last_error}")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def status(self) -> dict:
+        report = {
+            "state": self.state,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+        if self.state == self.OPEN:
+            report["retry_in_s"] = round(
+                max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1
+            )
+        return report
+
+
+class RconDispatcher:
+    """Очередь RCON-команд: собирает команды за короткое окно и отправляет пачкой.
+
+    Одинаковые команды из одного окна (повторный клик «Принять» по той же
+    заявке) выполняются один раз, ответ получают все вызывающие.
+    """
+
+    def __init__(
+        self,
+        pool: RconPool,
+        window: float = RCON_BATCH_WINDOW,
+        max_batch: int = RCON_BATCH_SIZE,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.pool = pool
+        self.breaker = breaker or CircuitBreaker()
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, command: str) -> str:
+        # Разомкнутый предохранитель отказывает сразу, не ставя команду в очередь
+        if self.breaker.state == CircuitBreaker.OPEN and not self._retry_due():
+            RCON_ERRORS.inc(RconUnavailableError.__name__)
+            raise RconUnavailableError("RCON временно недоступен")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(command, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _retry_due(self) -> bool:
+        return time.monotonic() - self.breaker.opened_at >= self.breaker.reset_timeout
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]):
+        if not self.breaker.allow():
+            results = [RconUnavailableError("RCON временно недоступен")] * len(batch)
+        else:
+            try:
+                results = await self.pool.run_batch(list(batch))
+            except Exception as e:
+                results = [e] * len(batch)
+            # Хотя бы один ответ означает, что сервер доступен
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if len(errors) < len(results):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure(errors[0])
+        # Ошибки считаются здесь, по одной на команду, — их видят все
+        # вызывающие, а не только execute_rcon_command
+        for result in results:
+            if isinstance(result, BaseException):
+                RCON_ERRORS.inc(type(result).__name__)
+        for waiters, result in zip(batch.values(), results):
+            for future in waiters:
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self):
+        """Отправляет накопленные команды и дожидается всех пачек"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+rcon_pool = RconPool()
+rcon_dispatcher = RconDispatcher(rcon_pool)
+
+
+async def execute_rcon_command(command: str, budget: float = RCON_CALL_BUDGET) -> str:
+    """Выполняет RCON-команду через общую очередь пула постоянных соединений.
+
+    ``budget`` — сколько секунд вызывающий готов ждать ответа вместе с
+    очередью; команда, не уложившаяся в него, всё равно дойдёт до сервера.
+    """
     try:
-        # Прямой синхронный вызов в потоке
-        def run_command():
-            with Client(
-                RCON_HOST, RCON_PORT, passwd=RCON_PASSWORD, timeout=5.0
-            ) as client:
-                return client.run(command)
-
-        result = await asyncio.to_thread(run_command)
+        result = await asyncio.wait_for(rcon_dispatcher.submit(command), budget)
         return str(result).strip()
+    except asyncio.TimeoutError:
+        # Команда всё ещё в очереди, её итог посчитает RconDispatcher
+        RCON_ERRORS.inc("CallBudgetExceeded")
+        return f"Ошибка: RCON не ответил за {budget:g} с"
     except Exception as e:
         return f"Ошибка: {type(e).__name__}: {str(e)}"
 
@@ -284,9 +2233,15 @@ class UserFormModal(Modal, title="📝 Анкета для вайтлиста"):
         max_length=100,
     )
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await allow_interaction(
+            interaction, registration_limiter, interaction_limiter
+        )
+
+    @instrumented("modal", "application_form")
     async def on_submit(self, interaction: discord.Interaction):
         # Проверяем, не зарегистрирован ли уже игрок
-        if database.check_player(interaction.user.id):
+        if await database.check_player(interaction.user.id):
             await interaction.response.send_message(
                 "❌ Вы уже зарегистрированы! Вы не можете подать заявку повторно.",
                 ephemeral=True,
@@ -300,38 +2255,36 @@ class UserFormModal(Modal, title="📝 Анкета для вайтлиста"):
             ephemeral=True,
         )
 
-        # Создаем View с кнопками для админов
-        admin_view = AdminView()
-        admin_view.applicant = interaction.user
-        admin_view.applicant_data = {
-            "minecraft": self.minecraft_username.value,
-            "country": self.country.value,
-            "rules": self.rules.value,
-        }
-
         # Отправляем заявку в канал модерации
         channel = bot.get_channel(APPLICATIONS_CHANNEL_ID)
         if channel:
-            embed = discord.Embed(
-                title="🆕 Новая заявка на вайтлист",
-                color=discord.Color.orange(),
-                timestamp=discord.utils.utcnow(),
+            # Сохраняем заявку в БД: кнопки найдут её по ID сообщения
+            application_id = await database.create_application(
+                interaction.user.id,
+                self.minecraft_username.value,
+                self.country.value,
+                self.rules.value,
             )
-            embed.add_field(
-                name="👤 Игрок",
-                value=f"{interaction.user.mention}\n`{interaction.user}`",
-                inline=False,
-            )
-            embed.add_field(
-                name="🎮 Ник в Minecraft",
-                value=f"`{self.minecraft_username.value}`",
-                inline=True,
+
+            embed = application_embed(
+                interaction.user.id,
+                self.minecraft_username.value,
+                self.country.value,
+                self.rules.value,
+                user=interaction.user,
             )
-            embed.add_field(name="🌍 Страна", value=self.country.value, inline=True)
-            embed.add_field(name="✅ Правила", value=self.rules.value, inline=False)
-            embed.set_footer(text=f"ID: {interaction.user.id}")
 
-            await channel.send(embed=embed, view=admin_view)
+            try:
+                message = await channel.send(embed=embed, view=AdminView.template())
+            except discord.HTTPException:
+                # Модераторы заявку не увидят — не оставляем её ожидающей в БД
+                await database.delete_application(application_id)
+                await interaction.followup.send(
+                    "⚠️ Не удалось передать анкету модераторам. Попробуйте позже.",
+                    ephemeral=True,
+                )
+                raise
+            await database.set_application_message(application_id, message.id)
 
 
 # ========== КНОПКА ДЛЯ ОТКРЫТИЯ АНКЕТЫ ==========
@@ -339,11 +2292,15 @@ class RegistrationButton(Button):
     def __init__(self):
         self.database = database
         super().__init__(
-            label="Подать заявку", style=discord.ButtonStyle.primary, emoji="✍️"
+            label="Подать заявку",
+            style=discord.ButtonStyle.primary,
+            emoji="✍️",
+            custom_id="registration_open",
         )
 
+    @instrumented("button", "register")
     async def callback(self, interaction: discord.Interaction):
-        if self.database.check_player(interaction.user.id):
+        if await self.database.check_player(interaction.user.id):
             await interaction.response.send_message(
                 "❌ Ты уже зарегистрирован! Вы не можете подать заявку повторно.",
                 ephemeral=True,
@@ -359,20 +2316,521 @@ class RegistrationView(View):
         super().__init__(timeout=None)
         self.add_item(RegistrationButton())
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await allow_interaction(
+            interaction, registration_limiter, interaction_limiter
+        )
+
 
 # ========== КНОПКИ АДМИНИСТРАТОРА ==========
 class AdminView(View):
+    """Кнопки модерации заявок.
+
+    Один экземпляр регистрируется через bot.add_view при запуске и обслуживает
+    все сообщения с заявками: заявка находится в БД по ID сообщения.
+    """
+
     def __init__(self):
         super().__init__(timeout=None)
-        self.applicant = None  # Будет установлен при создании заявки
-        self.applicant_data = None
-        self.message = None  # Для хранения сообщения с заявкой
 
         # Добавляем кнопки
         self.add_item(AcceptButton())
         self.add_item(DeclineButton())
         self.add_item(BanButton())
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await allow_interaction(interaction, admin_limiter(interaction))
+
+    @staticmethod
+    def template() -> "AdminView":
+        """Кнопки для нового сообщения с заявкой.
+
+        Остановленный View discord.py не привязывает к сообщению, поэтому
+        нажатия обрабатывает общий зарегистрированный экземпляр, а память
+        не растёт с числом заявок.
+        """
+        view = AdminView()
+        view.stop()
+        return view
+
+
+async def get_pending_application(interaction: discord.Interaction) -> Optional[dict]:
+    """Находит заявку по сообщению с кнопками; если её нельзя обработать — отвечает сам"""
+    application = await database.get_application_by_message(interaction.message.id)
+    if application is None:
+        await interaction.response.send_message(
+            "❌ Заявка не найдена в базе данных!", ephemeral=True
+        )
+        return None
+    if application["status"] != "pending":
+        await interaction.response.send_message(
+            "❌ Эта заявка уже обработана!", ephemeral=True
+        )
+        return None
+    return application
+
+
+async def resolve_user(user_id: int) -> discord.User:
+    return bot.get_user(user_id) or await bot.fetch_user(user_id)
+
+
+async def resolve_member(guild: discord.Guild, user_id: int) -> discord.Member:
+    """Участник из кэша; REST-запрос только при промахе (или без MEMBER_CACHE)"""
+    return guild.get_member(user_id) or await guild.fetch_member(user_id)
+
+
+# ========== ПАРАЛЛЕЛЬНОЕ ВЫПОЛНЕНИЕ ШАГОВ ==========
+class StepAborted(Exception):
+    """Шаг прерывает весь сценарий; текст уходит модератору"""
+
+
+class StepPipeline:
+    """Асинхронные шаги с зависимостями.
+
+    Шаг стартует, как только завершены шаги из ``after``, и получает их
+    результаты аргументами; независимые шаги выполняются параллельно. Ошибка
+    шага передаётся зависящим от него шагам. У каждого шага свой таймаут.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add(self, name: str, func, *, after=(), timeout: Optional[float] = None):
+        dependencies = [self._tasks[dependency] for dependency in after]
+
+        async def run():
+            args = [await dependency for dependency in dependencies]
+            return await asyncio.wait_for(watch_steps(f"step:{name}", func(*args)), timeout)
+
+        self._tasks[name] = asyncio.create_task(run(), name=name)
+
+    async def result(self, name: str):
+        return await self._tasks[name]
+
+    async def cancel(self):
+        """Отменяет незавершённые шаги и забирает их ошибки"""
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+# ========== OUTBOX ПОБОЧНЫХ ЭФФЕКТОВ ==========
+class PermanentEffectError(Exception):
+    """Эффект не выполнится и при повторе (участник ушёл, ЛС закрыты)"""
+
+
+async def _effect_rcon(payload: dict) -> str:
+    return await asyncio.wait_for(
+        rcon_dispatcher.submit(payload["command"]), RCON_CALL_BUDGET
+    )
+
+
+async def _effect_add_role(payload: dict):
+    guild = bot.get_guild(payload["guild_id"])
+    if guild is None:
+        raise RuntimeError(f"Сервер {payload['guild_id']} недоступен")
+    role = guild.get_role(payload["role_id"])
+    if role is None:
+        raise PermanentEffectError(f"Роль {payload['role_id']} не найдена")
+    try:
+        member = await resolve_member(guild, payload["user_id"])
+    except discord.NotFound:
+        raise PermanentEffectError("Участник покинул сервер")
+    try:
+        await member.add_roles(role, reason=payload.get("reason"))
+    except discord.Forbidden:
+        raise PermanentEffectError(
+            "У бота нет прав 'Управлять ролями' или роль выше роли бота"
+        )
+
+
+async def _effect_dm(payload: dict):
+    try:
+        user = await resolve_user(payload["user_id"])
+        await user.send(embed=discord.Embed.from_dict(payload["embed"]))
+    except (discord.Forbidden, discord.NotFound) as e:
+        raise PermanentEffectError(f"ЛС недоступны: {e}")
+
+
+OUTBOX_HANDLERS: Dict[str, Callable[[dict], Awaitable[object]]] = {
+    "rcon": _effect_rcon,
+    "add_role": _effect_add_role,
+    "dm": _effect_dm,
+}
+
+
+def describe_effect(kind: str, payload: dict) -> str:
+    """Запись outbox словами — для отчёта модераторам"""
+    if kind == "add_role":
+        return f"роль <@&{payload['role_id']}> для <@{payload['user_id']}>"
+    if kind == "rcon":
+        return f"RCON `{payload['command']}`"
+    if kind == "dm":
+        return f"ЛС для <@{payload['user_id']}>"
+    return kind
+
+
+async def report_failed_effects(failures: List[Tuple[str, dict, str]]):
+    """Сообщает в канал заявок о записях, которые не выполнятся без модератора"""
+    channel = bot.get_channel(APPLICATIONS_CHANNEL_ID)
+    if channel is None:
+        return
+    lines = ["⚠️ **Не выполнено после одобрения заявок — сделайте вручную:**"]
+    for kind, payload, error in failures:
+        lines.append(f"❌ {describe_effect(kind, payload)}: {error}")
+        lines.extend(
+            f"   ↳ не выполнено: {describe_effect(dependent, data)}"
+            for dependent, data in payload.get("then", ())
+        )
+    try:
+        await channel.send(
+            "\n".join(lines)[:2000], allowed_mentions=discord.AllowedMentions.none()
+        )
+    except discord.HTTPException as e:
+        print(f"⚠️ Не удалось сообщить о сбоях outbox: {e}")
+
+
+class OutboxWorker:
+    """Фоновое выполнение записей outbox с повторами.
+
+    Записи попадают в outbox той же транзакцией, что и решение по заявке,
+    поэтому обработчик отвечает модератору сразу, а сбой RCON или Discord
+    не теряет работу: запись повторяется с экспоненциальной паузой.
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, int] = {"pending": 0, "failed": 0}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self):
+        """Выполнить новые записи, не дожидаясь следующей проверки"""
+        self._wake.set()
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        return min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2**attempts)
+
+    async def _execute(self, entry: tuple):
+        outbox_id, kind, payload, attempts = entry
+        await OUTBOX_HANDLERS[kind](payload)
+
+    def _is_permanent(self, error: BaseException, attempts: int) -> bool:
+        return (
+            isinstance(error, PermanentEffectError)
+            or attempts + 1 >= OUTBOX_MAX_ATTEMPTS
+        )
+
+    async def drain(self) -> int:
+        """Один проход по наступившим записям; возвращает их число"""
+        entries = await database.get_due_outbox(OUTBOX_BATCH)
+        if not entries:
+            return 0
+        results = await gather_bounded(
+            (self._execute(entry) for entry in entries), OUTBOX_CONCURRENCY
+        )
+        done, retry, failed, follow_ups = [], [], [], []
+        failures = []
+        now = time.time()
+        for (outbox_id, kind, payload, attempts), result in zip(entries, results):
+            if not isinstance(result, BaseException):
+                done.append(outbox_id)
+                follow_ups.extend(payload.get("then", ()))
+                OUTBOX_EFFECTS.inc(kind, "done")
+                continue
+            error = f"{type(result).__name__}: {result}"
+            if self._is_permanent(result, attempts):
+                failed.append((outbox_id, error))
+                failures.append((kind, payload, str(result)))
+                OUTBOX_EFFECTS.inc(kind, "failed")
+                print(f"❌ Outbox {kind} #{outbox_id} не выполнен: {error}")
+                for dependent, _ in payload.get("then", ()):
+                    print(f"   ↳ зависимая запись {dependent} отменена")
+            else:
+                retry.append((outbox_id, now + self._backoff(attempts), error))
+                OUTBOX_EFFECTS.inc(kind, "retry")
+        await database.complete_outbox(done, retry, failed, follow_ups)
+        self.stats = await database.get_outbox_stats()
+        if failures:
+            await report_failed_effects(failures)
+        if follow_ups:
+            self.wake()
+        return len(entries)
+
+    async def run_inline(
+        self, entries: List[tuple], pipeline: StepPipeline, after=(), timeout=None
+    ) -> List[dict]:
+        """Выполняет только что добавленные записи outbox шагами ``pipeline``.
+
+        Запись из ``then`` становится шагом, зависящим от своей записи, так что
+        вайтлист в игре ждёт роль вайтлиста, а остальное идёт параллельно.
+        Записи должны быть добавлены с ``lease``, чтобы фоновый обработчик не
+        взял их одновременно. Выполненные записи удаляются, неудачные остаются
+        для повторов. Возвращает итоги: kind, payload, state
+        (done/retry/failed/waiting/skipped), result, error.
+        """
+        steps = []
+        for outbox_id, kind, payload in entries:
+            name = f"{kind}#{outbox_id}"
+            pipeline.add(
+                name,
+                lambda *_, kind=kind, payload=payload: OUTBOX_HANDLERS[kind](payload),
+                after=after,
+                timeout=timeout,
+            )
+            children = []
+            for i, (child_kind, child_payload) in enumerate(payload.get("then", ())):
+                child = f"{name}/{i}"
+                pipeline.add(
+                    child,
+                    lambda *_, kind=child_kind, payload=child_payload: (
+                        OUTBOX_HANDLERS[kind](payload)
+                    ),
+                    after=[name],
+                    timeout=timeout,
+                )
+                children.append((child, child_kind, child_payload))
+            steps.append((outbox_id, name, kind, payload, children))
+
+        async def outcome(name: str):
+            try:
+                return await pipeline.result(name), None
+            except Exception as e:
+                return None, e
+
+        outcomes = []
+        done, retry, failed, follow_ups = [], [], [], []
+        for outbox_id, name, kind, payload, children in steps:
+            result, error = await outcome(name)
+            if error is None:
+                done.append(outbox_id)
+                OUTBOX_EFFECTS.inc(kind, "done")
+                state = "done"
+            elif self._is_permanent(error, 0):
+                failed.append((outbox_id, f"{type(error).__name__}: {error}"))
+                OUTBOX_EFFECTS.inc(kind, "failed")
+                state = "failed"
+            else:
+                error_text = f"{type(error).__name__}: {error}"
+                retry.append((outbox_id, time.time() + self._backoff(0), error_text))
+                OUTBOX_EFFECTS.inc(kind, "retry")
+                state = "retry"
+            outcomes.append(
+                {
+                    "kind": kind,
+                    "payload": payload,
+                    "state": state,
+                    "result": result,
+                    "error": error,
+                }
+            )
+            for child, child_kind, child_payload in children:
+                child_result, child_error = await outcome(child)
+                if error is not None:
+                    # Продолжение выполнится после повтора своей записи или,
+                    # если она не выполнится, не выполнится вовсе
+                    child_state = "waiting" if state == "retry" else "skipped"
+                    child_result, child_error = None, None
+                elif child_error is None:
+                    child_state = "done"
+                    OUTBOX_EFFECTS.inc(child_kind, "done")
+                else:
+                    # Неудачное продолжение уходит в outbox отдельной записью
+                    child_state = "retry"
+                    follow_ups.append((child_kind, child_payload))
+                    OUTBOX_EFFECTS.inc(child_kind, "retry")
+                outcomes.append(
+                    {
+                        "kind": child_kind,
+                        "payload": child_payload,
+                        "state": child_state,
+                        "result": child_result,
+                        "error": child_error,
+                    }
+                )
+        await database.complete_outbox(done, retry, failed, follow_ups)
+        self.stats = await database.get_outbox_stats()
+        if follow_ups:
+            self.wake()
+        return outcomes
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        self.stats = await database.get_outbox_stats()
+        while True:
+            self._wake.clear()
+            try:
+                processed = await watch_steps("outbox:drain", self.drain())
+            except Exception as e:
+                print(f"⚠️ Ошибка обработки outbox: {type(e).__name__}: {e}")
+                processed = 0
+            if processed >= OUTBOX_BATCH:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+outbox_worker = OutboxWorker()
+
+
+# ========== ОБЩИЕ ШАГИ ОДОБРЕНИЯ ЗАЯВКИ ==========
+def application_embed(discord_id, mc_nickname, country, rules, user=None):
+    """Embed новой заявки для канала модерации"""
+    embed = discord.Embed(
+        title="🆕 Новая заявка на вайтлист",
+        color=discord.Color.orange(),
+        timestamp=discord.utils.utcnow(),
+    )
+    embed.add_field(
+        name="👤 Игрок",
+        value=f"<@{discord_id}>\n`{user}`" if user else f"<@{discord_id}>",
+        inline=False,
+    )
+    embed.add_field(name="🎮 Ник в Minecraft", value=f"`{mc_nickname}`", inline=True)
+    embed.add_field(name="🌍 Страна", value=country, inline=True)
+    embed.add_field(name="✅ Правила", value=rules, inline=False)
+    embed.set_footer(text=f"ID: {discord_id}")
+    return embed
+
+
+def mark_application_approved(
+    embed, moderator, whitelist_role, role_status_citizen, country, mc_username, rcon_response
+):
+    """Дополняет embed заявки итогами одобрения"""
+    embed.color = discord.Color.green()
+    embed.title = f"✅ ЗАЯВКА ОДОБРЕНА ({moderator.name})"
+    embed.add_field(name="Роль вайтлиста", value=whitelist_role.mention, inline=False)
+    embed.add_field(name="Роль гражданина", value=role_status_citizen, inline=False)
+    embed.add_field(name="Страна", value=country, inline=False)
+    embed.add_field(
+        name="RCON команда", value=f"`easywl add {mc_username}`", inline=False
+    )
+    embed.add_field(name="Ответ сервера", value=f"```{rcon_response}```", inline=False)
+    return embed
+
+
+def citizen_role_status(guild, registration: dict) -> str:
+    """Что будет с ролью гражданина по результату регистрации (для отчёта)"""
+    actual_country_name = registration["country"]
+    if "citizen_role_id" not in registration:
+        # Игрок зарегистрирован, но страны нет в БД
+        return f"⚠️ Роль гражданина НЕ ВЫДАНА. Страна '{actual_country_name}' не найдена в системе. Создайте страну через /createcountry и выдайте роль вручную."
+
+    citizen_role_id = registration["citizen_role_id"]
+    citizen_role = guild.get_role(citizen_role_id)
+    if not citizen_role:
+        return f"⚠️ Роль гражданина (ID: {citizen_role_id}) не найдена. Пожалуйста, выдайте роль вручную."
+    return f"⏳ Роль гражданина '{citizen_role.name}' будет выдана"
+
+
+def effect_status(outcome: Optional[dict]) -> str:
+    """Итог шага одобрения, выполненного через outbox, для отчёта модератору"""
+    if outcome is None:
+        return "—"
+    state, error = outcome["state"], outcome["error"]
+    if state == "done":
+        return "✅ Выполнено"
+    if state == "waiting":
+        return "⏳ После повтора предыдущего шага"
+    if state == "skipped":
+        return "⛔ Не выполнено: предыдущий шаг не удался"
+    if isinstance(error, PermanentEffectError):
+        reason = str(error)
+    else:
+        reason = f"{type(error).__name__}: {error}".rstrip(": ")
+    if state == "retry":
+        return f"⏳ Не удалось ({reason}), повтор в фоне"
+    return f"❌ {reason}"
+
+
+def acceptance_dm_embed(
+    guild, mc_username, registration: dict, moderator, whitelist_role
+) -> discord.Embed:
+    """ЛС игроку об одобрении заявки"""
+    embed = discord.Embed(
+        title="🎉 Заявка одобрена!",
+        description="Добро пожаловать на сервер!",
+        color=discord.Color.green(),
+    )
+    embed.add_field(name="Сервер", value=guild.name)
+    embed.add_field(name="Ваш ник в Minecraft", value=mc_username)
+    embed.add_field(name="Ваша страна", value=registration["country"])
+    embed.add_field(name="Администратор", value=moderator.mention)
+    embed.add_field(name="Роль вайтлиста", value=whitelist_role.mention)
+    if "citizen_role_id" in registration:
+        embed.add_field(
+            name="Роль гражданина", value=f"<@&{registration['citizen_role_id']}>"
+        )
+    return embed
+
+
+def acceptance_effects(guild, moderator, whitelist_role):
+    """Записи outbox для одобренной заявки: роли, вайтлист в игре и ЛС.
+
+    Записи из ``then`` добавляются в outbox только после успешного
+    выполнения родительской записи.
+
+    Возвращает функцию для Database.accept_applications: она вызывается в
+    потоке-писателе внутри транзакции регистрации.
+    """
+
+    def effects(application: dict, registration: dict) -> list:
+        user_id = application["discord_id"]
+        # Вайтлист в игре — только после роли вайтлиста: если выдать роль
+        # не удалось, игрок не должен оказаться на сервере
+        items = [
+            (
+                "add_role",
+                {
+                    "guild_id": guild.id,
+                    "user_id": user_id,
+                    "role_id": whitelist_role.id,
+                    "reason": "Вайтлист одобрен",
+                    "then": [
+                        ("rcon", {"command": f"easywl add {application['minecraft']}"})
+                    ],
+                },
+            )
+        ]
+        citizen_role_id = registration.get("citizen_role_id")
+        if citizen_role_id and guild.get_role(citizen_role_id):
+            items.append(
+                (
+                    "add_role",
+                    {
+                        "guild_id": guild.id,
+                        "user_id": user_id,
+                        "role_id": citizen_role_id,
+                        "reason": "Регистрация гражданина",
+                    },
+                )
+            )
+        embed = acceptance_dm_embed(
+            guild, application["minecraft"], registration, moderator, whitelist_role
+        )
+        items.append(("dm", {"user_id": user_id, "embed": embed.to_dict()}))
+        return items
+
+    return effects
+
+
+def decline_dm_embed(reason: str, moderator) -> discord.Embed:
+    embed = discord.Embed(title="❌ Заявка отклонена", color=discord.Color.red())
+    embed.add_field(name="Причина", value=reason)
+    embed.add_field(name="Администратор", value=moderator.mention)
+    return embed
+
 
 # ========== КЛАСС AcceptButton (ИСПРАВЛЕННЫЙ) ==========
 class AcceptButton(Button):
@@ -385,9 +2843,8 @@ class AcceptButton(Button):
             emoji="✅",
         )
 
+    @instrumented("button", "accept")
     async def callback(self, interaction: discord.Interaction):
-        view: AdminView = self.view
-
         # Проверка прав
         if not interaction.user.guild_permissions.manage_roles:
             await interaction.response.send_message(
@@ -395,8 +2852,13 @@ class AcceptButton(Button):
             )
             return
 
+        application = await get_pending_application(interaction)
+        if application is None:
+            return
+        applicant_id = application["discord_id"]
+
         # Проверяем, не зарегистрирован ли уже игрок
-        if self.database.check_player(view.applicant.id):
+        if await self.database.check_player(applicant_id):
             await interaction.response.send_message(
                 "❌ Этот игрок уже зарегистрирован!", ephemeral=True
             )
@@ -405,22 +2867,17 @@ class AcceptButton(Button):
         # Откладываем ответ, т.к. операции могут занять время
         await interaction.response.defer(ephemeral=True, thinking=True)
 
+        guild = interaction.guild
+        mc_username = application["minecraft"]
+
+        # Роли, вайтлист в игре и ЛС записываются в outbox той же транзакцией,
+        # что и регистрация, и сразу выполняются шагами конвейера; неудачные
+        # остаются в outbox и повторяются в фоне.
+        # участник -> БД + outbox -> (роль вайтлиста -> RCON | роль гражданина | ЛС)
+        #   -> (сообщение с заявкой | ответ админу)
+        pipeline = StepPipeline()
         try:
-            # 1. ПОИСК УЧАСТНИКА ГАРАНТИРОВАННО
-            guild = interaction.guild
-
-            # Способ 1: fetch_member (рекомендуется)
-            try:
-                member = await guild.fetch_member(view.applicant.id)
-            except discord.NotFound:
-                # Если пользователь покинул сервер
-                await interaction.followup.send(
-                    f"❌ Пользователь {view.applicant} не найден на сервере!",
-                    ephemeral=True,
-                )
-                return
-
-            # 2. ПОИСК РОЛИ ВАЙТЛИСТА
+            # ПОИСК РОЛИ ВАЙТЛИСТА
             whitelist_role = guild.get_role(WHITELIST_ROLE_ID)
             if not whitelist_role:
                 await interaction.followup.send(
@@ -428,156 +2885,112 @@ class AcceptButton(Button):
                 )
                 return
 
-            # 3. РЕГИСТРАЦИЯ ИГРОКА В БД
-            mc_username = view.applicant_data["minecraft"]
-            country_name = view.applicant_data["country"]
-
-            # Сначала пробуем стандартную регистрацию (если страна существует)
-            result_db_member_adding = self.database.register_player(
-                member.id, mc_username, country_name
-            )
-
-            if not result_db_member_adding["success"]:
-                error_msg = result_db_member_adding.get("error", "unknown_error")
-                if error_msg == "already_registered":
-                    await interaction.followup.send(
-                        "❌ Этот игрок уже зарегистрирован в базе данных!",
-                        ephemeral=True,
-                    )
-                    return
-                elif error_msg == "country_not_found":
-                    # Страна не найдена, регистрируем без проверки страны
-                    result_db_member_adding = (
-                        self.database.register_player_without_country_check(
-                            member.id, mc_username, country_name
-                        )
+            # 1. ПОИСК УЧАСТНИКА ГАРАНТИРОВАННО
+            async def find_member():
+                try:
+                    return await resolve_member(guild, applicant_id)
+                except discord.NotFound:
+                    # Если пользователь покинул сервер
+                    raise StepAborted(
+                        f"❌ Пользователь <@{applicant_id}> не найден на сервере!"
                     )
 
-                    if not result_db_member_adding["success"]:
-                        error_msg = result_db_member_adding.get(
-                            "error", "unknown_error"
-                        )
-                        if error_msg == "already_registered":
-                            await interaction.followup.send(
-                                "❌ Этот игрок уже зарегистрирован в базе данных!",
-                                ephemeral=True,
-                            )
-                        else:
-                            await interaction.followup.send(
-                                f"❌ Ошибка регистрации в БД: {error_msg}",
-                                ephemeral=True,
-                            )
-                        return
-
-                    # Игрок зарегистрирован, но страны нет в БД
-                    actual_country_name = result_db_member_adding["country"]
-                    citizen_role = None
-                    role_status_citizen = f"⚠️ Роль гражданина НЕ ВЫДАНА. Страна '{actual_country_name}' не найдена в системе. Создайте страну через /createcountry и выдайте роль вручную."
-                else:
-                    await interaction.followup.send(
-                        f"❌ Ошибка регистрации в БД: {error_msg}", ephemeral=True
-                    )
-                    return
-            else:
-                # Стандартный сценарий: страна найдена
-                citizen_role_id = result_db_member_adding["citizen_role_id"]
-                actual_country_name = result_db_member_adding["country"]
-                citizen_role = guild.get_role(citizen_role_id)
-
-                if not citizen_role:
-                    role_status_citizen = f"⚠️ Роль гражданина (ID: {citizen_role_id}) не найдена. Пожалуйста, выдайте роль вручную."
-                else:
-                    try:
-                        await member.add_roles(
-                            citizen_role, reason="Регистрация гражданина"
-                        )
-                        role_status_citizen = (
-                            f"✅ Роль гражданина '{citizen_role.name}' выдана"
+            # 2. РЕГИСТРАЦИЯ ИГРОКА В БД И ЗАПИСЬ ЭФФЕКТОВ В OUTBOX
+            async def register(member):
+                # Если страны нет в БД, игрок регистрируется без неё
+                (result,) = await self.database.accept_applications(
+                    [application],
+                    interaction.user.id,
+                    acceptance_effects(guild, interaction.user, whitelist_role),
+                    lease=OUTBOX_INLINE_LEASE,
+                )
+                if not result["success"]:
+                    error_msg = result.get("error", "unknown_error")
+                    if error_msg == "already_registered":
+                        raise StepAborted(
+                            "❌ Этот игрок уже зарегистрирован в базе данных!"
                         )
-                    except discord.Forbidden:
-                        role_status_citizen = "❌ Нет прав для выдачи роли гражданина"
-                    except discord.HTTPException as e:
-                        role_status_citizen = f"❌ Ошибка выдачи роли гражданина: {e}"
+                    if error_msg == "already_resolved":
+                        raise StepAborted("❌ Эта заявка уже обработана!")
+                    raise StepAborted(f"❌ Ошибка регистрации в БД: {error_msg}")
+                return result
+
+            pipeline.add("member", find_member, timeout=ACCEPT_STEP_TIMEOUT)
+            pipeline.add(
+                "registration", register, after=["member"], timeout=ACCEPT_STEP_TIMEOUT
+            )
 
-            # 4. ВЫДАЧА РОЛИ ВАЙТЛИСТА
             try:
-                await member.add_roles(whitelist_role, reason="Вайтлист одобрен")
-                role_status_whitelist = (
-                    f"✅ Роль вайтлиста '{whitelist_role.name}' выдана"
-                )
-            except discord.Forbidden:
-                role_status_whitelist = "❌ Нет прав для выдачи роли вайтлиста"
-                await interaction.followup.send(
-                    "❌ У бота нет прав 'Управлять ролями' или его роль слишком низкая!",
-                    ephemeral=True,
-                )
+                member = await pipeline.result("member")
+                registration = await pipeline.result("registration")
+            except StepAborted as e:
+                await pipeline.cancel()
+                await interaction.followup.send(str(e), ephemeral=True)
                 return
-            except discord.HTTPException as e:
-                role_status_whitelist = f"❌ Ошибка выдачи роли вайтлиста: {e}"
-                await interaction.followup.send(
-                    f"❌ Ошибка выдачи роли: {e}", ephemeral=True
-                )
-                return
-
-            # 5. RCON КОМАНДА
-            rcon_response = await execute_rcon_command(f"easywl add {mc_username}")
-
-            # 6. УВЕДОМЛЕНИЕ ИГРОКА В ЛС
-            dm_sent = False
-            try:
-                embed = discord.Embed(
-                    title="🎉 Заявка одобрена!",
-                    description="Добро пожаловать на сервер!",
-                    color=discord.Color.green(),
-                )
-                embed.add_field(name="Сервер", value=guild.name)
-                embed.add_field(name="Ваш ник в Minecraft", value=mc_username)
-                embed.add_field(name="Ваша страна", value=actual_country_name)
-                embed.add_field(name="Администратор", value=interaction.user.mention)
-                embed.add_field(name="Роль вайтлиста", value=whitelist_role.mention)
-                if citizen_role:
-                    embed.add_field(name="Роль гражданина", value=citizen_role.mention)
 
-                await view.applicant.send(embed=embed)
-                dm_sent = True
-            except discord.Forbidden:
-                dm_sent = False
-
-            # 7. ОБНОВЛЕНИЕ СООБЩЕНИЯ С ЗАЯВКОЙ
-            embed = interaction.message.embeds[0]
-            embed.color = discord.Color.green()
-            embed.title = f"✅ ЗАЯВКА ОДОБРЕНА ({interaction.user.name})"
-            embed.add_field(
-                name="Роль вайтлиста", value=whitelist_role.mention, inline=False
+            # 3. РОЛИ, ВАЙТЛИСТ В ИГРЕ И ЛС — ШАГАМИ С ТАЙМАУТАМИ
+            outcomes = await outbox_worker.run_inline(
+                registration["outbox"], pipeline, timeout=ACCEPT_STEP_TIMEOUT
             )
-            embed.add_field(
-                name="Роль гражданина", value=role_status_citizen, inline=False
-            )
-            embed.add_field(name="Страна", value=actual_country_name, inline=False)
-            embed.add_field(
-                name="RCON команда", value=f"`easywl add {mc_username}`", inline=False
+
+            def outcome_of(kind: str, role_id: Optional[int] = None) -> Optional[dict]:
+                for outcome in outcomes:
+                    if outcome["kind"] == kind and (
+                        role_id is None or outcome["payload"]["role_id"] == role_id
+                    ):
+                        return outcome
+                return None
+
+            actual_country_name = registration["country"]
+            citizen_role_id = registration.get("citizen_role_id")
+            citizen_outcome = (
+                outcome_of("add_role", citizen_role_id) if citizen_role_id else None
             )
-            embed.add_field(
-                name="Ответ сервера", value=f"```{rcon_response}```", inline=False
+            if citizen_outcome:
+                citizen_role = guild.get_role(citizen_role_id)
+                role_status_citizen = (
+                    f"'{citizen_role.name}': {effect_status(citizen_outcome)}"
+                )
+            else:
+                role_status_citizen = citizen_role_status(guild, registration)
+            rcon_outcome = outcome_of("rcon")
+            if rcon_outcome and rcon_outcome["state"] == "done":
+                rcon_response = rcon_outcome["result"] or "✅ Выполнено"
+            else:
+                rcon_response = effect_status(rcon_outcome)
+
+            # 4. ОБНОВЛЕНИЕ СООБЩЕНИЯ С ЗАЯВКОЙ
+            embed = mark_application_approved(
+                interaction.message.embeds[0],
+                interaction.user,
+                whitelist_role,
+                role_status_citizen,
+                actual_country_name,
+                mc_username,
+                rcon_response,
             )
 
-            await interaction.message.edit(embed=embed, view=None)
-
-            # 8. ФИНАЛЬНЫЙ ОТВЕТ АДМИНУ
+            # 5. ФИНАЛЬНЫЙ ОТВЕТ АДМИНУ
             message_lines = [
-                f"**✅ Заявка обработана!**",
+                "**✅ Заявка обработана!**",
                 f"👤 Игрок: {member.mention}",
                 f"🎮 Ник Minecraft: `{mc_username}`",
                 f"🌍 Страна: `{actual_country_name}`",
-                f"👑 Роль вайтлиста: {role_status_whitelist}",
+                f"👑 Роль вайтлиста '{whitelist_role.name}': "
+                f"{effect_status(outcome_of('add_role', whitelist_role.id))}",
                 f"🏛️ Роль гражданина: {role_status_citizen}",
-                f"🔗 RCON: `{rcon_response}`",
-                f"📨 ЛС игроку: {'✅ Отправлено' if dm_sent else '❌ Не отправлено'}",
+                f"🔗 RCON `easywl add {mc_username}`: {effect_status(rcon_outcome)}",
+                f"📨 ЛС игроку: {effect_status(outcome_of('dm'))}",
             ]
 
-            await interaction.followup.send("\n".join(message_lines), ephemeral=True)
+            # Правка заявки и ответ админу друг от друга не зависят
+            await asyncio.gather(
+                interaction.message.edit(embed=embed, view=None),
+                interaction.followup.send("\n".join(message_lines), ephemeral=True),
+            )
 
         except Exception as e:
+            await pipeline.cancel()
             # Детальная ошибка для отладки
             error_msg = (
                 f"**❌ КРИТИЧЕСКАЯ ОШИБКА:**\n"
@@ -601,29 +3014,33 @@ class DeclineModal(Modal, title="❌ Укажите причину отказа"
         max_length=500,
     )
 
-    def __init__(self, applicant):
+    def __init__(self, application: dict):
         super().__init__()
-        self.applicant = applicant
+        self.application = application
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await allow_interaction(interaction, admin_limiter(interaction))
 
+    @instrumented("modal", "decline")
     async def on_submit(self, interaction: discord.Interaction):
         # Сначала отвечаем на модальное окно
         await interaction.response.defer(ephemeral=True)
 
-        try:
-            # Уведомление игрока
-            try:
-                embed = discord.Embed(
-                    title="❌ Заявка отклонена", color=discord.Color.red()
-                )
-                embed.add_field(name="Причина", value=self.reason.value)
-                embed.add_field(name="Администратор", value=interaction.user.mention)
-
-                await self.applicant.send(embed=embed)
-            except discord.Forbidden:
-                await interaction.followup.send(
-                    "⚠️ Не удалось отправить ЛС игроку", ephemeral=True
-                )
+        # Уведомление игрока уходит в outbox вместе с решением по заявке
+        dm = {
+            "user_id": self.application["discord_id"],
+            "embed": decline_dm_embed(self.reason.value, interaction.user).to_dict(),
+        }
+        if not await database.resolve_application(
+            self.application["id"], "declined", interaction.user.id, [("dm", dm)]
+        ):
+            await interaction.followup.send(
+                "❌ Эта заявка уже обработана!", ephemeral=True
+            )
+            return
+        outbox_worker.wake()
 
+        try:
             # Обновление сообщения с заявкой
             message = interaction.message
             embed = message.embeds[0]
@@ -639,7 +3056,8 @@ class DeclineModal(Modal, title="❌ Укажите причину отказа"
             await message.edit(embed=embed, view=None)
 
             await interaction.followup.send(
-                f"✅ Игроку отправлено уведомление об отказе.", ephemeral=True
+                "✅ Заявка отклонена, уведомление игроку поставлено в очередь.",
+                ephemeral=True,
             )
 
         except Exception as e:
@@ -656,16 +3074,19 @@ class DeclineButton(Button):
             emoji="❌",
         )
 
+    @instrumented("button", "decline")
     async def callback(self, interaction: discord.Interaction):
-        view: AdminView = self.view
-
         if not interaction.user.guild_permissions.manage_roles:
             await interaction.response.send_message(
                 "❌ У вас недостаточно прав!", ephemeral=True
             )
             return
 
-        modal = DeclineModal(view.applicant)
+        application = await get_pending_application(interaction)
+        if application is None:
+            return
+
+        modal = DeclineModal(application)
         await interaction.response.send_modal(modal)
 
 
@@ -679,31 +3100,37 @@ class BanModal(Modal, title="🔨 Укажите причину бана"):
         max_length=500,
     )
 
-    def __init__(self, applicant, applicant_data):
+    def __init__(self, application: dict):
         super().__init__()
-        self.applicant = applicant
-        self.applicant_data = applicant_data
+        self.application = application
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await allow_interaction(interaction, admin_limiter(interaction))
 
+    @instrumented("modal", "ban")
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
-        try:
-            # 1. RCON бан (если нужно)
-            mc_username = self.applicant_data["minecraft"]
-            rcon_response = await execute_rcon_command(f"ban {mc_username}")
+        # Бан в игре уходит в outbox вместе с решением по заявке
+        mc_username = self.application["minecraft"]
+        if not await database.resolve_application(
+            self.application["id"],
+            "banned",
+            interaction.user.id,
+            [("rcon", {"command": f"ban {mc_username}"})],
+        ):
+            await interaction.followup.send(
+                "❌ Эта заявка уже обработана!", ephemeral=True
+            )
+            return
+        outbox_worker.wake()
 
-            # 2. Бан в Discord (опционально)
-            try:
-                await self.applicant.ban(
-                    reason=self.reason.value[:512], delete_message_days=0
-                )
-                discord_ban = "✅ Забанен в Discord"
-            except discord.Forbidden:
-                discord_ban = "❌ Нет прав для бана в Discord"
-            except Exception:
-                discord_ban = "⚠️ Ошибка бана в Discord"
+        try:
+            # 1. RCON бан — в очереди outbox
+            rcon_response = f"⏳ ban {mc_username} в очереди"
 
-            # 3. Уведомление игрока
+            # 2. Уведомление игрока — до бана в Discord: после него у бота
+            # с игроком нет общего сервера и ЛС не доставить
             try:
                 embed = discord.Embed(
                     title="🔨 Вы забанены", color=discord.Color.dark_red()
@@ -711,15 +3138,25 @@ class BanModal(Modal, title="🔨 Укажите причину бана"):
                 embed.add_field(name="Причина", value=self.reason.value)
                 embed.add_field(name="Администратор", value=interaction.user.mention)
                 embed.add_field(name="Ник в Minecraft", value=mc_username)
-                embed.add_field(
-                    name="Статус",
-                    value=f"Discord: {discord_ban}\nMinecraft: {rcon_response}",
-                )
 
-                await self.applicant.send(embed=embed)
-            except discord.Forbidden:
+                applicant = await resolve_user(self.application["discord_id"])
+                await applicant.send(embed=embed)
+            except (discord.Forbidden, discord.NotFound):
                 pass
 
+            # 3. Бан в Discord (опционально)
+            try:
+                await interaction.guild.ban(
+                    discord.Object(id=self.application["discord_id"]),
+                    reason=self.reason.value[:512],
+                    delete_message_days=0,
+                )
+                discord_ban = "✅ Забанен в Discord"
+            except discord.Forbidden:
+                discord_ban = "❌ Нет прав для бана в Discord"
+            except Exception:
+                discord_ban = "⚠️ Ошибка бана в Discord"
+
             # 4. Обновление сообщения с заявкой
             message = interaction.message
             embed = message.embeds[0]
@@ -736,142 +3173,676 @@ class BanModal(Modal, title="🔨 Укажите причину бана"):
                 value=f"```{rcon_response}```",
                 inline=False,
             )
+            embed.add_field(name="💬 Discord", value=discord_ban, inline=False)
 
             await message.edit(embed=embed, view=None)
 
-            await interaction.followup.send(
-                f"✅ Игрок забанен. Причина: {self.reason.value[:100]}", ephemeral=True
-            )
+            await interaction.followup.send(
+                f"✅ Игрок забанен. Причина: {self.reason.value[:100]}\n{discord_ban}",
+                ephemeral=True,
+            )
+
+        except Exception as e:
+            await interaction.followup.send(f"❌ Ошибка: {str(e)}", ephemeral=True)
+
+
+# ========== КНОПКА БАНА ==========
+class BanButton(Button):
+    def __init__(self):
+        super().__init__(
+            label="Забанить",
+            style=discord.ButtonStyle.danger,
+            custom_id="ban_btn",
+            emoji="🔨",
+        )
+
+    @instrumented("button", "ban")
+    async def callback(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.ban_members:
+            await interaction.response.send_message(
+                "❌ У вас нет прав на бан!", ephemeral=True
+            )
+            return
+
+        application = await get_pending_application(interaction)
+        if application is None:
+            return
+
+        modal = BanModal(application)
+        await interaction.response.send_modal(modal)
+
+
+# ========== КОМАНДЫ БОТА ==========
+@tree.command(name="register", description="Открыть регистрацию")
+@app_commands.checks.has_permissions(administrator=True)
+@instrumented("command", "register")
+async def register_command(interaction: discord.Interaction):
+    """Команда для создания сообщения с кнопкой регистрации"""
+    if not interaction.user.guild_permissions.manage_messages:
+        await interaction.response.send_message(
+            "❌ У вас нет прав на эту команду!", ephemeral=True
+        )
+        return
+
+    view = RegistrationView()
+    await interaction.response.send_message(
+        "📢 **Регистрация на вайтлист открыта!**\n"
+        "Нажмите кнопку ниже, чтобы подать заявку.\n"
+        "⚠️ **Внимание:** Каждый игрок может зарегистрироваться только один раз!",
+        view=view,
+    )
+
+
+@tree.command(name="toggleleader", description="Присвоить/отобрать лидерство")
+@app_commands.checks.has_permissions(manage_roles=True)
+@app_commands.describe(member="Участник")
+@instrumented("command", "toggleleader")
+async def toggle_leader(interaction, member: discord.Member):
+    result = await database.toggle_player_leader(member.id)
+    if result["success"]:
+        guild = interaction.guild
+        leader_role = guild.get_role(LEADER_ROLE_ID)
+        if result["new_status"]:
+            await member.add_roles(leader_role)
+            await interaction.response.send_message(
+                f"{member.mention} теперь лидер страны {result['country']}!"
+            )
+        else:
+            await member.remove_roles(leader_role)
+            await interaction.response.send_message(
+                f"{member.mention} больше не является лидером страны {result['country']}."
+            )
+    else:
+        await interaction.response.send_message(
+            "❗️ Ошибка взаимодействия", ephemeral=True
+        )
+
+
+@tree.command(name="createcountry", description="Создать новую страну")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    country_name="Название страны", citizen_role_id="ID роли гражданина страны"
+)
+@instrumented("command", "createcountry")
+async def new_country(interaction, country_name: str, citizen_role_id: str):
+    try:
+        role_id = int(citizen_role_id)
+        result = await database.create_country(country_name, role_id)
+        if result:
+            await interaction.response.send_message(
+                f"✅ Успешно создана страна под названием **{country_name}** с ролью ID `{role_id}`",
+                ephemeral=True,
+            )
+        else:
+            await interaction.response.send_message(
+                "❌ Ошибка создания страны. Возможно, страна с таким названием уже существует.",
+                ephemeral=True,
+            )
+    except ValueError:
+        await interaction.response.send_message(
+            "❌ Неверный формат ID роли. ID должен быть числом.", ephemeral=True
+        )
+
+
+@tree.command(name="addkarma", description="Добавить/отнять стране кармы")
+@app_commands.checks.has_permissions(manage_roles=True)
+@app_commands.describe(
+    country_name="Название страны",
+    quantity="Количество кармы (отрицательное если отнять)",
+)
+@instrumented("command", "addkarma")
+async def add_karma(interaction, country_name: str, quantity: int):
+    result = await database.modify_karma_value(
+        country_name, quantity, interaction.user.id
+    )
+    if result:
+        current_karma = await database.get_country_karma(country_name)
+        if current_karma is not None:
+            await interaction.response.send_message(
+                f"✅ Количество кармы страны **{country_name}** изменено на **{quantity:+d}**. "
+                f"Текущая карма: **{current_karma}**",
+                ephemeral=True,
+            )
+        else:
+            await interaction.response.send_message(
+                f"✅ Карма страны **{country_name}** изменена на {quantity:+d}",
+                ephemeral=True,
+            )
+    else:
+        await interaction.response.send_message(
+            f"❌ Страна '{country_name}' не найдена!", ephemeral=True
+        )
+
+
+# ========== МАССОВАЯ ОБРАБОТКА ЗАЯВОК ==========
+async def gather_bounded(coros, limit: int = BULK_CONCURRENCY) -> list:
+    """gather, но одновременно выполняется не больше ``limit`` корутин.
+
+    Ошибки возвращаются в списке результатов, как при return_exceptions=True.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=True)
+
+
+def parse_message_ids(text: Optional[str]) -> Optional[List[int]]:
+    """ID сообщений через пробел или запятую; пустая строка — все заявки"""
+    if not text:
+        return None
+    return [int(part) for part in text.replace(",", " ").split()]
+
+
+def bulk_report(title: str, lines: List[str], started: float) -> str:
+    """Итоговый отчёт одним сообщением с усечённым списком заявок"""
+    report = [title, f"⏱️ Время: {time.perf_counter() - started:.1f} с"]
+    report.extend(lines[:BULK_REPORT_LINES])
+    if len(lines) > BULK_REPORT_LINES:
+        report.append(f"… и ещё {len(lines) - BULK_REPORT_LINES}")
+    return "\n".join(report)[:2000]
+
+
+async def edit_application_message(application: dict, embed: discord.Embed):
+    """Обновляет сообщение с заявкой без его предварительной загрузки"""
+    channel = bot.get_channel(APPLICATIONS_CHANNEL_ID)
+    if channel and application["message_id"]:
+        await channel.get_partial_message(application["message_id"]).edit(
+            embed=embed, view=None
+        )
+
+
+@tree.command(name="bulkaccept", description="Одобрить несколько заявок сразу")
+@app_commands.checks.has_permissions(manage_roles=True)
+@app_commands.describe(
+    applications="ID сообщений с заявками через пробел (пусто — все ожидающие)"
+)
+@instrumented("command", "bulkaccept")
+async def bulk_accept(interaction: discord.Interaction, applications: str = ""):
+    try:
+        message_ids = parse_message_ids(applications)
+    except ValueError:
+        await interaction.response.send_message(
+            "❌ ID сообщений должны быть числами.", ephemeral=True
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    started = time.perf_counter()
+    guild = interaction.guild
+    whitelist_role = guild.get_role(WHITELIST_ROLE_ID)
+    if not whitelist_role:
+        await interaction.followup.send(
+            f"❌ Роль с ID {WHITELIST_ROLE_ID} не найдена!", ephemeral=True
+        )
+        return
+
+    pending = await database.get_pending_applications(message_ids)
+    if not pending:
+        await interaction.followup.send("ℹ️ Нет ожидающих заявок.", ephemeral=True)
+        return
+
+    # 1. Участники сервера: покинувшие сервер пропускаются
+    async def find_member(application):
+        try:
+            return await resolve_member(guild, application["discord_id"])
+        except discord.NotFound:
+            return None
+
+    members = await gather_bounded(find_member(a) for a in pending)
+    lines = []
+    accepted = []
+    for application, member in zip(pending, members):
+        if member is None or isinstance(member, Exception):
+            lines.append(
+                f"⚠️ <@{application['discord_id']}> (`{application['minecraft']}`): "
+                "не найден на сервере"
+            )
+        else:
+            accepted.append((application, member))
+
+    # 2. Регистрация, закрытие заявок и outbox одной транзакцией: роли,
+    # вайтлист в игре и ЛС выполнит фоновый обработчик outbox
+    registrations = await database.accept_applications(
+        [application for application, _ in accepted],
+        interaction.user.id,
+        acceptance_effects(guild, interaction.user, whitelist_role),
+    )
+    outbox_worker.wake()
+    registered = []
+    for (application, member), registration in zip(accepted, registrations):
+        if registration["success"]:
+            registered.append((application, member, registration))
+        else:
+            error = registration["error"]
+            if error == "already_registered":
+                error = "уже зарегистрирован"
+            elif error == "already_resolved":
+                error = "заявка уже обработана"
+            lines.append(f"❌ {member.mention} (`{application['minecraft']}`): {error}")
+
+    # 3. Сообщения с заявками — с ограничением параллельности
+    async def finish(application, member, registration):
+        embed = mark_application_approved(
+            application_embed(
+                application["discord_id"],
+                application["minecraft"],
+                application["country"],
+                application["rules"],
+                user=member,
+            ),
+            interaction.user,
+            whitelist_role,
+            citizen_role_status(guild, registration),
+            registration["country"],
+            application["minecraft"],
+            "⏳ После выдачи роли вайтлиста",
+        )
+        await edit_application_message(application, embed)
+
+    results = await gather_bounded(finish(*item) for item in registered)
+    for (application, member, _), result in zip(registered, results):
+        if isinstance(result, Exception):
+            status = f"✅ принят, но сообщение не обновлено: {result}"
+        else:
+            status = "✅ принят"
+        lines.append(f"{member.mention} (`{application['minecraft']}`): {status}")
+
+    await interaction.followup.send(
+        bulk_report(
+            f"**Одобрено заявок: {len(registered)} из {len(pending)}**",
+            lines,
+            started,
+        ),
+        ephemeral=True,
+    )
+
+
+@tree.command(name="bulkdecline", description="Отклонить несколько заявок сразу")
+@app_commands.checks.has_permissions(manage_roles=True)
+@app_commands.describe(
+    reason="Причина отказа",
+    applications="ID сообщений с заявками через пробел (пусто — все ожидающие)",
+)
+@instrumented("command", "bulkdecline")
+async def bulk_decline(
+    interaction: discord.Interaction, reason: str, applications: str = ""
+):
+    try:
+        message_ids = parse_message_ids(applications)
+    except ValueError:
+        await interaction.response.send_message(
+            "❌ ID сообщений должны быть числами.", ephemeral=True
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    started = time.perf_counter()
+    reason = reason[:500]
+
+    pending = await database.get_pending_applications(message_ids)
+    # Уведомления игрокам уходят в outbox вместе с решением по заявкам
+    dm_embed = decline_dm_embed(reason, interaction.user).to_dict()
+    resolved = set(
+        await database.resolve_applications(
+            [application["id"] for application in pending],
+            "declined",
+            interaction.user.id,
+            {
+                application["id"]: [
+                    ("dm", {"user_id": application["discord_id"], "embed": dm_embed})
+                ]
+                for application in pending
+            },
+        )
+    )
+    outbox_worker.wake()
+    declined = [a for a in pending if a["id"] in resolved]
+    if not declined:
+        await interaction.followup.send("ℹ️ Нет ожидающих заявок.", ephemeral=True)
+        return
+
+    async def finish(application):
+        embed = application_embed(
+            application["discord_id"],
+            application["minecraft"],
+            application["country"],
+            application["rules"],
+        )
+        embed.color = discord.Color.red()
+        embed.title = "❌ ЗАЯВКА ОТКЛОНЕНА"
+        embed.add_field(name="📋 Причина", value=reason, inline=False)
+        embed.add_field(
+            name="👨‍⚖️ Администратор", value=interaction.user.mention, inline=False
+        )
+        await edit_application_message(application, embed)
+
+    results = await gather_bounded(finish(a) for a in declined)
+    lines = []
+    for application, result in zip(declined, results):
+        if isinstance(result, Exception):
+            status = f"✅ отклонена, но сообщение не обновлено: {result}"
+        else:
+            status = "✅ отклонена"
+        lines.append(
+            f"<@{application['discord_id']}> (`{application['minecraft']}`): {status}"
+        )
+
+    await interaction.followup.send(
+        bulk_report(f"**Отклонено заявок: {len(declined)}**", lines, started),
+        ephemeral=True,
+    )
+
+
+# ========== СВЕРКА ВАЙТЛИСТА ==========
+WHITELIST_COUNT_PATTERN = re.compile(r"\((\d+)\)")
+WHITELIST_EMPTY_PATTERN = re.compile(r"Whitelisted players \(0\):?", re.IGNORECASE)
+
+
+def parse_whitelist(response: str) -> Set[str]:
+    """Ники из ответа easywl list: «Whitelisted players (N): a, b, c».
+
+    Пустым считается только точный ответ плагина «Whitelisted players (0):».
+    Нераспознанный или усечённый ответ — ValueError: по нему нельзя
+    удалять игроков из вайтлиста.
+    """
+    text = re.sub(r"§.", "", response).strip()
+    if WHITELIST_EMPTY_PATTERN.fullmatch(text):
+        return set()
+    header, separator, names = text.partition(":")
+    nicknames = {name for name in re.split(r"[\s,]+", names) if name}
+    if not separator or not nicknames or "whitelist" not in header.lower():
+        raise ValueError(f"Нераспознанный ответ easywl list: {text[:100]!r}")
+    count = WHITELIST_COUNT_PATTERN.search(header)
+    if count and int(count.group(1)) != len(nicknames):
+        raise ValueError(
+            f"easywl list сообщил {count.group(1)} игроков, получено {len(nicknames)}"
+        )
+    return nicknames
+
+
+class WhitelistReconciler:
+    """Периодическая сверка вайтлиста сервера с зарегистрированными игроками.
+
+    Вайтлист читается одной командой easywl list, расхождение считается
+    разностью множеств без учёта регистра (как в Minecraft), и на сервер
+    уходят только недостающие add и remove — одной пачкой через очередь RCON.
+    Удаление включается WHITELIST_RECONCILE_REMOVE, иначе лишние ники только
+    попадают в отчёт.
+    """
+
+    def __init__(self, interval: float = WHITELIST_RECONCILE_INTERVAL):
+        self.interval = interval
+        self.last_report: Optional[dict] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    async def diff() -> Tuple[List[str], List[str], int]:
+        """(кого добавить, кого удалить, размер вайтлиста сервера)
+
+        Игроки, которым ещё не выдана роль вайтлиста (запись add_role в outbox
+        ждёт повтора или упала), не добавляются, но и не удаляются.
+        """
+        response, nicknames, awaiting = await asyncio.gather(
+            execute_rcon_command("easywl list"),
+            database.get_player_nicknames(),
+            database.get_nicknames_awaiting_role(WHITELIST_ROLE_ID),
+        )
+        server = {nickname.casefold(): nickname for nickname in parse_whitelist(response)}
+        registered = {nickname.casefold(): nickname for nickname in nicknames}
+        pending = {nickname.casefold() for nickname in awaiting}
+        to_add = sorted(
+            registered[key] for key in registered.keys() - server.keys() - pending
+        )
+        to_remove = sorted(
+            server[key] for key in server.keys() - registered.keys() - WHITELIST_EXEMPT
+        )
+        return to_add, to_remove, len(server)
+
+    async def reconcile(self, dry_run: bool = False) -> dict:
+        async with self._lock:
+            started = time.perf_counter()
+            to_add, to_remove, whitelisted = await self.diff()
+            # Без WHITELIST_RECONCILE_REMOVE лишние только попадают в отчёт.
+            # Массовое удаление скорее говорит об ошибке (пустая БД, чужой
+            # ответ сервера), чем о реальном расхождении — его решает человек
+            held_back, hold_reason = [], None
+            if not WHITELIST_RECONCILE_REMOVE:
+                held_back, to_remove, hold_reason = to_remove, [], "удаление выключено"
+            elif len(to_remove) > WHITELIST_RECONCILE_MAX_REMOVALS:
+                held_back, to_remove = to_remove, []
+                hold_reason = f"лимит {WHITELIST_RECONCILE_MAX_REMOVALS}"
+
+            commands = [f"easywl add {nickname}" for nickname in to_add] + [
+                f"easywl remove {nickname}" for nickname in to_remove
+            ]
+            errors = []
+            if commands and not dry_run:
+                results = await asyncio.gather(
+                    *(rcon_dispatcher.submit(command) for command in commands),
+                    return_exceptions=True,
+                )
+                for command, result in zip(commands, results):
+                    if isinstance(result, BaseException):
+                        errors.append(f"{command}: {type(result).__name__}: {result}")
+                        WHITELIST_RECONCILE_CHANGES.inc("error")
+                    else:
+                        WHITELIST_RECONCILE_CHANGES.inc(command.split()[1])
+
+            elapsed = time.perf_counter() - started
+            if not dry_run:
+                WHITELIST_RECONCILE_SECONDS.observe(elapsed)
+            self.last_report = {
+                "added": to_add,
+                "removed": to_remove,
+                "held_back": held_back,
+                "hold_reason": hold_reason,
+                "errors": errors,
+                "whitelisted": whitelisted,
+                "dry_run": dry_run,
+                "ms": round(elapsed * 1000, 1),
+                "finished_at": time.time(),
+            }
+            print(
+                f"🔄 Сверка вайтлиста{' (пробная)' if dry_run else ''} за "
+                f"{elapsed * 1000:.0f} мс: +{len(to_add)} -{len(to_remove)}, "
+                f"не удалено {len(held_back)}, ошибок {len(errors)}"
+            )
+            for error in errors:
+                print(f"   ❌ {error}")
+            if held_back:
+                print(
+                    f"   ⚠️ Не удалено {len(held_back)} игроков без регистрации "
+                    f"({hold_reason}): {', '.join(held_back[:20])}"
+                )
+            return self.last_report
+
+    def status(self) -> dict:
+        """Краткие итоги последней сверки для /ready"""
+        if self.last_report is None:
+            return {"ok": None, "error": "ещё не выполнялась"}
+        report = self.last_report
+        return {
+            "ok": not report["errors"]
+            and not (report["held_back"] and WHITELIST_RECONCILE_REMOVE),
+            "added": len(report["added"]),
+            "removed": len(report["removed"]),
+            "held_back": len(report["held_back"]),
+            "removals": WHITELIST_RECONCILE_REMOVE,
+            "errors": len(report["errors"]),
+            "ms": report["ms"],
+            "age_s": round(time.time() - report["finished_at"], 1),
+        }
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        while True:
+            try:
+                await watch_steps("whitelist:reconcile", self.reconcile())
+            except Exception as e:
+                print(f"⚠️ Сверка вайтлиста не выполнена: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+whitelist_reconciler = WhitelistReconciler()
+
+
+@tree.command(name="syncwhitelist", description="Сверить вайтлист сервера с базой")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(dry_run="Только показать расхождения, ничего не меняя")
+@instrumented("command", "syncwhitelist")
+async def sync_whitelist(interaction: discord.Interaction, dry_run: bool = False):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    started = time.perf_counter()
+    try:
+        report = await whitelist_reconciler.reconcile(dry_run)
+    except Exception as e:
+        await interaction.followup.send(
+            f"❌ Сверка не выполнена: {type(e).__name__}: {e}", ephemeral=True
+        )
+        return
+
+    prefix = "будет " if dry_run else ""
+    lines = [f"➕ {prefix}добавлен `{nickname}`" for nickname in report["added"]]
+    lines += [f"➖ {prefix}удалён `{nickname}`" for nickname in report["removed"]]
+    lines += [
+        f"⚠️ не удалён ({report['hold_reason']}) `{nickname}`"
+        for nickname in report["held_back"]
+    ]
+    lines += [f"❌ {error}" for error in report["errors"]]
+    title = (
+        f"**Сверка вайтлиста{' (пробная)' if dry_run else ''}:** "
+        f"в вайтлисте {report['whitelisted']}, "
+        f"+{len(report['added'])} -{len(report['removed'])}"
+    )
+    await interaction.followup.send(
+        bulk_report(title, lines or ["✅ Расхождений нет"], started), ephemeral=True
+    )
+
 
-        except Exception as e:
-            await interaction.followup.send(f"❌ Ошибка: {str(e)}", ephemeral=True)
+# ========== КЭШ РЕЙТИНГОВ ==========
+class LeaderboardCache:
+    """Готовые строки и embed'ы рейтингов /karma и /countries.
 
+    Сбрасывается целиком при создании страны, изменении кармы и регистрации
+    игрока (см. AsyncDatabase.on_change), так что команды отвечают из памяти.
+    """
 
-# ========== КНОПКА БАНА ==========
-class BanButton(Button):
     def __init__(self):
-        super().__init__(
-            label="Забанить",
-            style=discord.ButtonStyle.danger,
-            custom_id="ban_btn",
-            emoji="🔨",
-        )
+        self._entries: Dict[str, tuple] = {}
+        self._version = 0
 
-    async def callback(self, interaction: discord.Interaction):
-        view: AdminView = self.view
+    def invalidate(self):
+        self._entries.clear()
+        self._version += 1
 
-        if not interaction.user.guild_permissions.ban_members:
-            await interaction.response.send_message(
-                "❌ У вас нет прав на бан!", ephemeral=True
-            )
-            return
+    async def get(
+        self, key: str, build: Callable[[], Awaitable[tuple]]
+    ) -> Tuple[List[tuple], Optional[discord.Embed]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            version = self._version
+            entry = await build()
+            # Пока строили, данные могли измениться — такой результат не кэшируем
+            if version == self._version:
+                self._entries[key] = entry
+        return entry
 
-        modal = BanModal(view.applicant, view.applicant_data)
-        await interaction.response.send_modal(modal)
 
+leaderboard_cache = LeaderboardCache()
 
-# ========== КОМАНДЫ БОТА ==========
-@tree.command(name="register", description="Открыть регистрацию")
-@app_commands.checks.has_permissions(administrator=True)
-async def register_command(interaction: discord.Interaction):
-    """Команда для создания сообщения с кнопкой регистрации"""
-    if not interaction.user.guild_permissions.manage_messages:
-        await interaction.response.send_message(
-            "❌ У вас нет прав на эту команду!", ephemeral=True
-        )
-        return
 
-    view = RegistrationView()
-    await interaction.response.send_message(
-        "📢 **Регистрация на вайтлист открыта!**\n"
-        "Нажмите кнопку ниже, чтобы подать заявку.\n"
-        "⚠️ **Внимание:** Каждый игрок может зарегистрироваться только один раз!",
-        view=view,
+async def build_karma_leaderboard(period: Optional[str] = None):
+    """Строки и embed топа стран по карме (за всё время или за период)"""
+    if period:
+        countries = await database.get_karma_leaderboard(period)
+    else:
+        countries = await database.get_all_countries()
+
+    if not countries:
+        return countries, None
+
+    embed = discord.Embed(
+        title=f"🏆 Топ стран по карме {KARMA_PERIODS[period]}"
+        if period
+        else "🏆 Топ стран по карме",
+        color=discord.Color.gold(),
+        timestamp=discord.utils.utcnow(),
     )
 
+    for i, (country_id, name, role_id, karma) in enumerate(countries[:10], 1):
+        medal = ""
+        if i == 1:
+            medal = "🥇 "
+        elif i == 2:
+            medal = "🥈 "
+        elif i == 3:
+            medal = "🥉 "
 
-@tree.command(name="toggleleader", description="Присвоить/отобрать лидерство")
-@app_commands.checks.has_permissions(manage_roles=True)
-@app_commands.describe(member="Участник")
-async def toggle_leader(interaction, member: discord.Member):
-    result = database.toggle_player_leader(member.id)
-    if result["success"]:
-        guild = interaction.guild
-        leader_role = guild.get_role(LEADER_ROLE_ID)
-        if result["new_status"]:
-            await member.add_roles(leader_role)
-            await interaction.response.send_message(
-                f"{member.mention} теперь лидер страны {result['country']}!"
-            )
-        else:
-            await member.remove_roles(leader_role)
-            await interaction.response.send_message(
-                f"{member.mention} больше не является лидером страны {result['country']}."
-            )
-    else:
-        await interaction.response.send_message(
-            "❗️ Ошибка взаимодействия", ephemeral=True
+        embed.add_field(
+            name=f"{medal}{i}. {name}", value=f"📊 **{karma}** кармы", inline=False
         )
 
+    embed.set_footer(text=f"Всего стран: {len(countries)}")
+    return countries, embed
 
-@tree.command(name="createcountry", description="Создать новую страну")
-@app_commands.checks.has_permissions(administrator=True)
-@app_commands.describe(
-    country_name="Название страны", citizen_role_id="ID роли гражданина страны"
-)
-async def new_country(interaction, country_name: str, citizen_role_id: str):
-    try:
-        role_id = int(citizen_role_id)
-        result = database.create_country(country_name, role_id)
-        if result:
-            await interaction.response.send_message(
-                f"✅ Успешно создана страна под названием **{country_name}** с ролью ID `{role_id}`",
-                ephemeral=True,
-            )
-        else:
-            await interaction.response.send_message(
-                "❌ Ошибка создания страны. Возможно, страна с таким названием уже существует.",
-                ephemeral=True,
-            )
-    except ValueError:
-        await interaction.response.send_message(
-            "❌ Неверный формат ID роли. ID должен быть числом.", ephemeral=True
-        )
 
+async def build_countries_overview():
+    """Строки и embed статистики по всем странам"""
+    stats = await database.get_country_stats()
 
-@tree.command(name="addkarma", description="Добавить/отнять стране кармы")
-@app_commands.checks.has_permissions(manage_roles=True)
-@app_commands.describe(
-    country_name="Название страны",
-    quantity="Количество кармы (отрицательное если отнять)",
-)
-async def add_karma(interaction, country_name: str, quantity: int):
-    result = database.modify_karma_value(country_name, quantity)
-    if result:
-        current_karma = database.get_country_karma(country_name)
-        if current_karma is not None:
-            await interaction.response.send_message(
-                f"✅ Количество кармы страны **{country_name}** изменено на **{quantity:+d}**. "
-                f"Текущая карма: **{current_karma}**",
-                ephemeral=True,
-            )
-        else:
-            await interaction.response.send_message(
-                f"✅ Карма страны **{country_name}** изменена на {quantity:+d}",
-                ephemeral=True,
-            )
-    else:
-        await interaction.response.send_message(
-            f"❌ Страна '{country_name}' не найдена!", ephemeral=True
+    if not stats:
+        return stats, None
+
+    embed = discord.Embed(
+        title="🌍 Все страны сервера",
+        color=discord.Color.blue(),
+        timestamp=discord.utils.utcnow(),
+    )
+
+    for name, karma, citizens_count in stats:
+        embed.add_field(
+            name=f"**{name}**",
+            value=f"📊 Карма: **{karma}**\n👥 Граждан: **{citizens_count}**",
+            inline=True,
         )
 
+    embed.set_footer(text=f"Всего стран: {len(stats)}")
+    return stats, embed
+
 
 @tree.command(name="karma", description="Показать карму страны")
-@app_commands.describe(country_name="Название страны (необязательно)")
-async def show_karma(interaction, country_name: Optional[str] = None):
+@app_commands.describe(
+    country_name="Название страны (необязательно)",
+    period="Период рейтинга (по умолчанию — за всё время)",
+)
+@app_commands.choices(
+    period=[
+        app_commands.Choice(name=label, value=period)
+        for period, label in KARMA_PERIODS.items()
+    ]
+)
+@instrumented("command", "karma")
+async def show_karma(
+    interaction,
+    country_name: Optional[str] = None,
+    period: Optional[app_commands.Choice[str]] = None,
+):
     if country_name:
         # Показать карму конкретной страны
-        karma = database.get_country_karma(country_name)
+        karma = await database.get_country_karma(country_name)
         if karma is not None:
             embed = discord.Embed(
                 title=f"Карма страны: {country_name}",
@@ -884,8 +3855,17 @@ async def show_karma(interaction, country_name: Optional[str] = None):
                 f"❌ Страна '{country_name}' не найдена!", ephemeral=True
             )
     else:
-        # Показать топ стран
-        countries = database.get_all_countries()
+        # Показать топ стран (за всё время или за выбранный период).
+        # Оконный рейтинг кэшируется вместе с началом периода, чтобы
+        # смена суток/недели/месяца не отдавала старый топ
+        if period:
+            bucket = karma_bucket_start(period.value, int(time.time()))
+            key = f"karma:{period.value}:{bucket}"
+        else:
+            key = "karma"
+        countries, embed = await leaderboard_cache.get(
+            key, lambda: build_karma_leaderboard(period.value if period else None)
+        )
 
         if not countries:
             await interaction.response.send_message(
@@ -893,33 +3873,14 @@ async def show_karma(interaction, country_name: Optional[str] = None):
             )
             return
 
-        embed = discord.Embed(
-            title="🏆 Топ стран по карме",
-            color=discord.Color.gold(),
-            timestamp=discord.utils.utcnow(),
-        )
-
-        for i, (country_id, name, role_id, karma) in enumerate(countries[:10], 1):
-            medal = ""
-            if i == 1:
-                medal = "🥇 "
-            elif i == 2:
-                medal = "🥈 "
-            elif i == 3:
-                medal = "🥉 "
-
-            embed.add_field(
-                name=f"{medal}{i}. {name}", value=f"📊 **{karma}** кармы", inline=False
-            )
-
-        embed.set_footer(text=f"Всего стран: {len(countries)}")
         await interaction.response.send_message(embed=embed)
 
 
 @tree.command(name="countries", description="Список всех стран с информацией")
+@instrumented("command", "countries")
 async def list_countries(interaction: discord.Interaction):
     """Показать статистику по всем странам"""
-    stats = database.get_country_stats()
+    stats, embed = await leaderboard_cache.get("countries", build_countries_overview)
 
     if not stats:
         await interaction.response.send_message(
@@ -927,27 +3888,14 @@ async def list_countries(interaction: discord.Interaction):
         )
         return
 
-    embed = discord.Embed(
-        title="🌍 Все страны сервера",
-        color=discord.Color.blue(),
-        timestamp=discord.utils.utcnow(),
-    )
-
-    for name, karma, citizens_count in stats:
-        embed.add_field(
-            name=f"**{name}**",
-            value=f"📊 Карма: **{karma}**\n👥 Граждан: **{citizens_count}**",
-            inline=True,
-        )
-
-    embed.set_footer(text=f"Всего стран: {len(stats)}")
     await interaction.response.send_message(embed=embed)
 
 
 @tree.command(name="myprofile", description="Показать ваш профиль")
+@instrumented("command", "myprofile")
 async def my_profile(interaction: discord.Interaction):
     """Показать информацию о профиле игрока"""
-    player_data = database.get_player(interaction.user.id)
+    player_data = await database.get_player(interaction.user.id)
 
     if not player_data:
         await interaction.response.send_message(
@@ -956,7 +3904,7 @@ async def my_profile(interaction: discord.Interaction):
         return
 
     reg_id, discord_id, mc_nickname, country, is_leader = player_data
-    country_karma = database.get_country_karma(country)
+    country_karma = await database.get_country_karma(country)
 
     embed = discord.Embed(
         title=f"👤 Профиль {interaction.user.name}",
@@ -983,10 +3931,11 @@ async def my_profile(interaction: discord.Interaction):
 @tree.command(name="checkplayer", description="Проверить, зарегистрирован ли игрок")
 @app_commands.checks.has_permissions(manage_roles=True)
 @app_commands.describe(member="Участник Discord")
+@instrumented("command", "checkplayer")
 async def check_player(interaction: discord.Interaction, member: discord.Member):
     """Проверить статус регистрации игрока"""
-    if database.check_player(member.id):
-        player_data = database.get_player(member.id)
+    if await database.check_player(member.id):
+        player_data = await database.get_player(member.id)
         reg_id, discord_id, mc_nickname, country, is_leader = player_data
 
         embed = discord.Embed(
@@ -1009,49 +3958,407 @@ async def check_player(interaction: discord.Interaction, member: discord.Member)
 
 
 # ========== СОБЫТИЯ БОТА ==========
+class StartupTimer:
+    """Замеры этапов запуска; отчёт печатается один раз после первого on_ready"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self._open: Dict[str, float] = {}
+        self.completed = False
+
+    def begin(self, name: str):
+        self._open[name] = time.perf_counter()
+
+    def end(self, name: str):
+        self.phases.append((name, time.perf_counter() - self._open.pop(name)))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def report(self):
+        lines = ["⏱️ Время запуска:"]
+        lines.extend(f"   {name}: {duration * 1000:.0f} мс" for name, duration in self.phases)
+        lines.append(f"   всего: {(time.perf_counter() - self.started) * 1000:.0f} мс")
+        print("\n".join(lines))
+
+
+startup = StartupTimer()
+
+
+def command_tree_hash() -> str:
+    """Хэш определений слэш-команд в том виде, в каком они уходят в Discord"""
+    payload = [command.to_dict(tree) for command in tree.get_commands()]
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+async def sync_commands():
+    """Синхронизирует команды, только если они изменились с прошлой синхронизации"""
+    tree_hash = command_tree_hash()
+    if await database.get_state("command_tree_hash") == tree_hash:
+        print("✅ Слэш-команды не изменились, синхронизация пропущена")
+        return
+    await tree.sync()
+    await database.set_state("command_tree_hash", tree_hash)
+    print("✅ Слэш-команды синхронизированы")
+
+
+def registration_embed() -> discord.Embed:
+    embed = discord.Embed(
+        title="Привет, путник!",
+        description=(
+            "Добро пожаловать на Кармалис!\n"
+            "Чтобы начать игру на сервере, заполни небольшую анкету и дождись одобрения!\n\n"
+            "**⚠️ Внимание:** Каждый игрок может зарегистрироваться только **один раз**!\n"
+            "Перед тем, как подать анкету, просим тебя ознакомиться с <#1445468851591712918>ми сервера."
+        ),
+        color=discord.Color.blue(),
+    )
+    embed.set_footer(text="Подавая анкету, ты соглашаешься с правилами сервера.")
+    return embed
+
+
+async def publish_registration_message(channel):
+    """Обновляет сообщение с кнопкой регистрации на месте; новое — только если его нет"""
+    embed = registration_embed()
+    view = RegistrationView()
+    message_id = await database.get_state("announcement_message_id")
+    if message_id is None:
+        # Сообщение от версии, не сохранявшей ID, — подхватываем его
+        async for msg in channel.history(limit=10):
+            if msg.author == bot.user and msg.components:
+                message_id = str(msg.id)
+                break
+
+    if message_id is not None:
+        try:
+            await channel.get_partial_message(int(message_id)).edit(
+                embed=embed, view=view
+            )
+            await database.set_state("announcement_message_id", message_id)
+            print(f"✅ Сообщение в канале {channel.name} обновлено")
+            return
+        except discord.NotFound:
+            pass
+
+    message = await channel.send(embed=embed, view=view)
+    await database.set_state("announcement_message_id", str(message.id))
+    print(f"✅ Сообщение отправлено в канал {channel.name}")
+
+
 @bot.event
 async def on_ready():
+    # on_ready повторяется после переподключений к шлюзу — настройку делаем один раз
+    if startup.completed:
+        print("🔁 Переподключение к Discord")
+        return
+    startup.completed = True
+    startup.end("подключение к шлюзу")
+
     print(f"✅ Бот {bot.user} запущен!")
     print(f"📊 Серверов: {len(bot.guilds)}")
 
     # Синхронизация команд
-    try:
-        await tree.sync()
-        print("✅ Слэш-команды синхронизированы")
-    except Exception as e:
-        print(f"⚠️ Ошибка синхронизации команд: {e}")
+    with startup.phase("синхронизация команд"):
+        try:
+            await sync_commands()
+        except Exception as e:
+            print(f"⚠️ Ошибка синхронизации команд: {e}")
 
-    # Отправка сообщения с кнопкой в канал
+    # Сообщение с кнопкой в канале
     channel = bot.get_channel(ANNOUNCEMENT_CHANNEL_ID)
     if channel:
-        try:
-            # Проверяем, нет ли уже нашего сообщения
-            async for msg in channel.history(limit=10):
-                if msg.author == bot.user and msg.components:
-                    await msg.delete()  # Удаляем старое сообщение
+        with startup.phase("сообщение регистрации"):
+            try:
+                await publish_registration_message(channel)
+            except discord.Forbidden:
+                print("❌ Нет прав для отправки сообщения в канал")
+            except Exception as e:
+                print(f"⚠️ Ошибка отправки сообщения: {e}")
 
-            # Создаем новое
-            view = RegistrationView()
-            embed = discord.Embed(
-                title="Привет, путник!",
-                description=(
-                    "Добро пожаловать на Кармалис!\n"
-                    "Чтобы начать игру на сервере, заполни небольшую анкету и дождись одобрения!\n\n"
-                    "**⚠️ Внимание:** Каждый игрок может зарегистрироваться только **один раз**!\n"
-                    "Перед тем, как подать анкету, просим тебя ознакомиться с <#1445468851591712918>ми сервера."
-                ),
-                color=discord.Color.blue(),
-            )
-            embed.set_footer(
-                text="Подавая анкету, ты соглашаешься с правилами сервера."
-            )
-
-            await channel.send(embed=embed, view=view)
-            print(f"✅ Сообщение отправлено в канал {channel.name}")
-        except discord.Forbidden:
-            print("❌ Нет прав для отправки сообщения в канал")
+    startup.report()
+
+
+# ========== JSON API ==========
+class ApiSnapshot:
+    """Снимок данных для JSON API в памяти.
+
+    Каждый ресурс хранится одним списком строк, а страницы нарезаются из
+    него, поэтому запрос любой страницы не обращается к SQLite и не добавляет
+    записей в кэш. Снимок сбрасывается вместе с рейтингами
+    (AsyncDatabase.on_change). ETag строится из версии снимка и параметров
+    страницы, так что с If-None-Match ответ 304 отдаётся без сериализации.
+    """
+
+    def __init__(self):
+        self._rows: Dict[str, Tuple[object, list]] = {}
+        self._players: Optional[Dict[int, dict]] = None
+        self._version = 0
+        # Версия после перезапуска начинается заново — ETag прежнего процесса
+        # не должен совпасть с новым
+        self._epoch = f"{time.time_ns():x}"
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self):
+        self._rows.clear()
+        self._players = None
+        self._version += 1
+
+    async def players(self) -> Dict[int, dict]:
+        if self._players is None:
+            version = self._version
+            players = {
+                discord_id: {
+                    "discord_id": str(discord_id),
+                    "minecraft": mc_nickname,
+                    "country": country,
+                    "is_leader": bool(is_leader),
+                }
+                for discord_id, mc_nickname, country, is_leader in (
+                    await database.get_all_players()
+                )
+            }
+            if version != self._version:
+                return players
+            self._players = players
+        return self._players
+
+    async def rows(
+        self, name: str, build: Callable[[], Awaitable[list]], stamp=None
+    ) -> Tuple[int, list]:
+        """Строки ресурса и версия снимка, по которой они построены.
+
+        ``stamp`` — дополнительный признак свежести (например, начало суток
+        для рейтинга за период): при его смене список строится заново.
+        """
+        version = self._version
+        cached = self._rows.get(name)
+        if cached is not None and cached[0] == stamp:
+            return version, cached[1]
+        rows = await build()
+        # Пока строили, данные могли измениться — такой список не кэшируем
+        if version == self._version:
+            self._rows[name] = (stamp, rows)
+        return version, rows
+
+    def etag(self, version: int, *parts) -> str:
+        tag = ":".join(str(part) for part in (self._epoch, version) + parts)
+        return '"' + hashlib.sha1(tag.encode()).hexdigest()[:20] + '"'
+
+
+api_snapshot = ApiSnapshot()
+
+
+def _page_params(request) -> Tuple[int, int]:
+    try:
+        page = int(request.query.get("page", 1))
+        per_page = int(request.query.get("per_page", API_PAGE_SIZE))
+    except ValueError:
+        raise web.HTTPBadRequest(text="page и per_page должны быть числами")
+    if page < 1 or not 1 <= per_page <= API_MAX_PAGE_SIZE:
+        raise web.HTTPBadRequest(
+            text=f"page >= 1, per_page от 1 до {API_MAX_PAGE_SIZE}"
+        )
+    return page, per_page
+
+
+def _paginate(items: list, page: int, per_page: int) -> dict:
+    start = (page - 1) * per_page
+    return {
+        "items": items[start : start + per_page],
+        "page": page,
+        "per_page": per_page,
+        "total": len(items),
+    }
+
+
+def _api_response(request, etag: str, payload: Callable[[], object]) -> web.Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match.strip() == "*" or etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ):
+        return web.Response(status=304, headers=headers)
+    return web.Response(
+        body=json.dumps(payload(), ensure_ascii=False).encode("utf-8"),
+        content_type="application/json",
+        charset="utf-8",
+        headers=headers,
+    )
+
+
+async def api_countries_handler(request):
+    """Страны с кармой и числом граждан (данные /countries)"""
+    page, per_page = _page_params(request)
+
+    async def build():
+        return [
+            {"name": name, "karma": karma, "citizens": citizens}
+            for name, karma, citizens in await database.get_country_stats()
+        ]
+
+    version, countries = await api_snapshot.rows("countries", build)
+    return _api_response(
+        request,
+        api_snapshot.etag(version, "countries", page, per_page),
+        lambda: _paginate(countries, page, per_page),
+    )
+
+
+async def api_leaderboard_handler(request):
+    """Рейтинг по карме за всё время или за period=day|week|month"""
+    page, per_page = _page_params(request)
+    period = request.query.get("period") or None
+    if period is not None and period not in KARMA_PERIODS:
+        raise web.HTTPBadRequest(text=f"period: {', '.join(KARMA_PERIODS)}")
+
+    async def build():
+        if period:
+            rows = await database.get_karma_leaderboard(period)
+        else:
+            rows = await database.get_all_countries()
+        return [
+            {"rank": rank, "name": name, "karma": karma}
+            for rank, (_, name, _, karma) in enumerate(rows, 1)
+        ]
+
+    # Рейтинг за период меняется и при смене суток/недели/месяца
+    bucket = karma_bucket_start(period, int(time.time())) if period else None
+    version, leaderboard = await api_snapshot.rows(
+        f"leaderboard:{period}", build, stamp=bucket
+    )
+    return _api_response(
+        request,
+        api_snapshot.etag(version, "leaderboard", period, bucket, page, per_page),
+        lambda: dict(_paginate(leaderboard, page, per_page), period=period),
+    )
+
+
+async def api_players_handler(request):
+    """Список игроков постранично"""
+    page, per_page = _page_params(request)
+
+    async def build():
+        return list((await api_snapshot.players()).values())
+
+    version, players = await api_snapshot.rows("players", build)
+    return _api_response(
+        request,
+        api_snapshot.etag(version, "players", page, per_page),
+        lambda: _paginate(players, page, per_page),
+    )
+
+
+async def api_player_handler(request):
+    """Профиль игрока по Discord ID"""
+    try:
+        discord_id = int(request.match_info["discord_id"])
+    except ValueError:
+        raise web.HTTPBadRequest(text="Discord ID должен быть числом")
+    version = api_snapshot.version
+    player = (await api_snapshot.players()).get(discord_id)
+    if player is None:
+        raise web.HTTPNotFound(text="Игрок не найден")
+    return _api_response(
+        request, api_snapshot.etag(version, "player", discord_id), lambda: player
+    )
+
+
+# ========== ПРОВЕРКИ ЗДОРОВЬЯ ==========
+class HealthProbes:
+    """Фоновые проверки БД и RCON с кэшированием результата.
+
+    HTTP-запросы к /ready читают только кэш, поэтому частый опрос платформой
+    не создаёт нагрузки на БД и сервер Minecraft.
+    """
+
+    def __init__(
+        self,
+        interval: float = HEALTH_PROBE_INTERVAL,
+        ttl: float = HEALTH_PROBE_TTL,
+        timeout: float = HEALTH_PROBE_TIMEOUT,
+    ):
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self.results: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self, name: str, check: Callable[[], Awaitable[None]]):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(watch_steps(f"health:{name}", check()), self.timeout)
+            error = None
         except Exception as e:
-            print(f"⚠️ Ошибка отправки сообщения: {e}")
+            error = f"{type(e).__name__}: {e}"
+        self.results[name] = {
+            "ok": error is None,
+            "error": error,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "checked_at": time.monotonic(),
+        }
+
+    @staticmethod
+    async def _check_rcon():
+        # Недавний полученный ответ уже доказывает доступность сервера;
+        # команды, упавшие по таймауту, этого не доказывают
+        if any(
+            connection.connected
+            and connection.last_success is not None
+            and time.monotonic() - connection.last_success < HEALTH_PROBE_INTERVAL
+            for connection in rcon_pool.connections
+        ):
+            return
+        await rcon_pool.run("list")
+
+    async def _run(self):
+        while True:
+            await asyncio.gather(
+                self._probe("database", database.ping),
+                self._probe("rcon", self._check_rcon),
+            )
+            await asyncio.sleep(self.interval)
+
+    def get(self, name: str) -> dict:
+        result = self.results.get(name)
+        if result is None:
+            return {"ok": False, "error": "ещё не проверялось"}
+        age = time.monotonic() - result["checked_at"]
+        report = {key: value for key, value in result.items() if key != "checked_at"}
+        report["age_s"] = round(age, 1)
+        if age > self.ttl:
+            report.update(ok=False, error="результат проверки устарел")
+        return report
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+health_probes = HealthProbes()
+
+
+def gateway_status() -> dict:
+    latency = bot.latency
+    return {
+        "ok": bot.is_ready() and not bot.is_closed(),
+        "latency_ms": round(latency * 1000, 1) if math.isfinite(latency) else None,
+    }
 
 
 async def health_check_handler(request):
@@ -1059,11 +4366,66 @@ async def health_check_handler(request):
     return web.Response(text="Discord bot is running")
 
 
+async def liveness_handler(request):
+    """Liveness: процесс жив и event loop отвечает; 503 — бот закрыт, нужен перезапуск"""
+    alive = not bot.is_closed()
+    return web.json_response(
+        {
+            "status": "ok" if alive else "closed",
+            "loop_lag_ms": loop_monitor.stats()["last_ms"],
+        },
+        status=200 if alive else 503,
+    )
+
+
+async def readiness_handler(request):
+    """Readiness: шлюз Discord и БД обязательны, недоступный RCON — деградация"""
+    checks = {
+        "gateway": gateway_status(),
+        "database": health_probes.get("database"),
+        "rcon": dict(
+            health_probes.get("rcon"), breaker=rcon_dispatcher.breaker.status()
+        ),
+        "outbox": outbox_worker.stats,
+        "whitelist": whitelist_reconciler.status(),
+    }
+    ready = checks["gateway"]["ok"] and checks["database"]["ok"]
+    if not ready:
+        status = "not_ready"
+    elif not checks["rcon"]["ok"]:
+        status = "degraded"
+    else:
+        status = "ready"
+    return web.json_response(
+        {"status": status, "checks": checks}, status=200 if ready else 503
+    )
+
+
+async def metrics_handler(request):
+    """Метрики в текстовом формате Prometheus"""
+    PENDING_APPLICATIONS.set(await database.count_pending_applications())
+    return web.Response(
+        text=render_metrics(), content_type="text/plain", charset="utf-8"
+    )
+
+
+async def loop_stats_handler(request):
+    """Статистика задержки event loop и последние медленные шаги"""
+    return web.json_response(loop_monitor.stats())
+
+
 async def start_background_server(host="0.0.0.0", port=8080):
     """Запуск фонового HTTP-сервера для поддержания работы бота"""
     app = web.Application()
     app.router.add_get("/", health_check_handler)
-    app.router.add_get("/health", health_check_handler)
+    app.router.add_get("/health", liveness_handler)
+    app.router.add_get("/ready", readiness_handler)
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/loop", loop_stats_handler)
+    app.router.add_get("/api/countries", api_countries_handler)
+    app.router.add_get("/api/leaderboard", api_leaderboard_handler)
+    app.router.add_get("/api/players", api_players_handler)
+    app.router.add_get("/api/players/{discord_id}", api_player_handler)
 
     runner = web.AppRunner(app)
     await runner.setup()
@@ -1087,25 +4449,66 @@ def is_port_available(port=8080):
 
 async def start_bot_with_server():
     """Основная функция для запуска бота и HTTP-сервера"""
+    shutdown: List[asyncio.Task] = []
     try:
         # Запускаем HTTP-сервер в фоне
         runner = await start_background_server()
+        loop_monitor.start()
+        rcon_pool.start()
+        database.start()
+        health_probes.start()
+        outbox_worker.start()
+        whitelist_reconciler.start()
+
+        # Один общий обработчик кнопок для всех заявок, включая созданные
+        # до перезапуска, и кнопка регистрации
+        with startup.phase("регистрация view"):
+            bot.add_view(AdminView())
+            bot.add_view(RegistrationView())
+
+        # Heroku останавливает процесс по SIGTERM, вручную — Ctrl+C (SIGINT).
+        # В обоих случаях закрываем бота штатно, чтобы отработал finally и
+        # буфер кармы записался в БД
+        def request_shutdown():
+            if not shutdown:
+                shutdown.append(asyncio.create_task(bot.close()))
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signum, request_shutdown)
+            except NotImplementedError:
+                pass
 
         # Запускаем Discord бота
-        await bot.start(TOKEN)
+        with startup.phase("вход в Discord"):
+            await bot.login(TOKEN)
+        startup.begin("подключение к шлюзу")
+        await bot.connect()
 
     except Exception as e:
         print(f"❌ Ошибка при запуске: {e}")
         raise
     finally:
+        if shutdown:
+            await shutdown[0]
         # Останавливаем HTTP-сервер при выходе
         await runner.cleanup()
+        loop_monitor.stop()
+        health_probes.stop()
+        outbox_worker.stop()
+        whitelist_reconciler.stop()
+        await rcon_dispatcher.close()
+        await rcon_pool.close()
+        database.close()
 
 
 # ========== ЗАПУСК БОТА ==========
 if __name__ == "__main__":
     global database
-    database = Database()
+    with startup.phase("инициализация БД"):
+        database = AsyncDatabase(Database())
+    database.on_change.append(leaderboard_cache.invalidate)
+    database.on_change.append(api_snapshot.invalidate)
     if database is not None:
         print("БД успешно инициализирована!")
 
@@ -1127,6 +4530,9 @@ if __name__ == "__main__":
         # Запускаем основную задачу
         loop.run_until_complete(start_bot_with_server())
     except KeyboardInterrupt:
+        # Без обработчика сигналов (Windows) finally не отработал —
+        # записываем буфер кармы здесь
+        database.close()
         print("👋 Бот остановлен пользователем")
     except Exception as e:
         print(f"❌ Критическая ошибка: {e}")
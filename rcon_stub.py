@@ -0,0 +1,292 @@
+"""Локальный сервер Source RCON для проверки бота без настоящего Minecraft.
+
+Понимает авторизацию и выполнение команд, отвечает на easywl add/remove/list,
+ban, pardon и list как сервер с плагином EasyWhitelist. Умеет замедлять ответы,
+дробить их на пакеты и мелкие TCP-сегменты, отклонять пароль и обрывать соединения.
+
+Примеры:
+    python rcon_stub.py --port 25575 --password secret
+    python rcon_stub.py --delay 0.05 --jitter 0.02 --tcp-chunk 7
+    python rcon_stub.py --drop-rate 0.05 --whitelisted 5000
+
+Бот и бенчмарк подключаются к нему так:
+    RCON_HOST=127.0.0.1 RCON_PORT=25575 RCON_PASSWORD=secret python main.py
+    python bench.py --rcon 127.0.0.1:25575 --rcon-password secret
+"""
+
+import argparse
+import asyncio
+import random
+import struct
+from typing import Dict, Optional, Set
+
+RCON_TYPE_RESPONSE = 0
+RCON_TYPE_EXEC = 2
+RCON_TYPE_AUTH_RESPONSE = 2
+RCON_TYPE_AUTH = 3
+RCON_FRAGMENT_SIZE = 4096  # Столько байт ответа помещает в пакет Minecraft
+
+
+class RconStubServer:
+    """Имитация RCON-сервера Minecraft.
+
+    Как и ванильный сервер, каждое соединение обрабатывает пакеты строго по
+    одному. Состояние (вайтлист, баны) общее для всех соединений. Ники, как
+    и в Minecraft, сравниваются без учёта регистра.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 25575,
+        password: str = "stub",
+        *,
+        delay: float = 0.0,
+        jitter: float = 0.0,
+        fragment_size: int = RCON_FRAGMENT_SIZE,
+        tcp_chunk: int = 0,
+        reject_auth: bool = False,
+        drop_rate: float = 0.0,
+        drop_after: int = 0,
+        whitelisted: int = 0,
+        verbose: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.delay = delay
+        self.jitter = jitter
+        self.fragment_size = fragment_size
+        self.tcp_chunk = tcp_chunk
+        self.reject_auth = reject_auth
+        self.drop_rate = drop_rate
+        self.drop_after = drop_after
+        self.verbose = verbose
+        # Ключ — ник в нижнем регистре, значение — ник в написании при добавлении
+        self.whitelist: Dict[str, str] = {
+            f"player{i}": f"Player{i}" for i in range(whitelisted)
+        }
+        self.banned: Set[str] = set()
+        self.commands = 0
+        self.connections = 0
+        self.drops = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    # ---------- Команды ----------
+    def execute(self, command: str) -> str:
+        args = command.split()
+        if not args:
+            return ""
+        name, args = args[0].lower().lstrip("/"), args[1:]
+
+        if name == "easywl" and args:
+            action, nicknames = args[0].lower(), args[1:]
+            if action == "add" and nicknames:
+                key = nicknames[0].casefold()
+                if key in self.whitelist:
+                    return f"{self.whitelist[key]} is already whitelisted"
+                self.whitelist[key] = nicknames[0]
+                return f"Added {nicknames[0]} to the whitelist"
+            if action == "remove" and nicknames:
+                nickname = self.whitelist.pop(nicknames[0].casefold(), None)
+                if nickname is None:
+                    return f"{nicknames[0]} is not whitelisted"
+                return f"Removed {nickname} from the whitelist"
+            if action == "list":
+                players = sorted(self.whitelist.values(), key=str.casefold)
+                return f"Whitelisted players ({len(players)}): {', '.join(players)}"
+            return "Usage: /easywl <add|remove|list> [player]"
+
+        if name == "ban" and args:
+            self.banned.add(args[0].casefold())
+            reason = " ".join(args[1:]) or "Banned by an operator."
+            return f"Banned {args[0]}: {reason}"
+        if name == "pardon" and args:
+            self.banned.discard(args[0].casefold())
+            return f"Unbanned {args[0]}"
+        if name == "list":
+            return "There are 0 of a max of 20 players online: "
+        return f"Unknown or incomplete command, see below for error\n{command}<--[HERE]"
+
+    # ---------- Протокол ----------
+    @staticmethod
+    def _packet(request_id: int, packet_type: int, body: bytes) -> bytes:
+        return struct.pack("<iii", len(body) + 10, request_id, packet_type) + body + b"\x00\x00"
+
+    async def _write(self, writer: asyncio.StreamWriter, data: bytes):
+        """Отправляет данные, при tcp_chunk — мелкими отдельными TCP-записями"""
+        if not self.tcp_chunk:
+            writer.write(data)
+            await writer.drain()
+            return
+        for start in range(0, len(data), self.tcp_chunk):
+            writer.write(data[start : start + self.tcp_chunk])
+            await writer.drain()
+            await asyncio.sleep(0)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        peer = writer.get_extra_info("peername")
+        self.log(f"+ {peer}")
+        authenticated = False
+        handled = 0
+        try:
+            while True:
+                (length,) = struct.unpack("<i", await reader.readexactly(4))
+                data = await reader.readexactly(length)
+                request_id, packet_type = struct.unpack("<ii", data[:8])
+                body = data[8:-2].decode("utf-8", errors="replace")
+
+                if packet_type == RCON_TYPE_AUTH:
+                    authenticated = not self.reject_auth and body == self.password
+                    await self._write(
+                        writer,
+                        self._packet(request_id, RCON_TYPE_RESPONSE, b"")
+                        + self._packet(
+                            request_id if authenticated else -1,
+                            RCON_TYPE_AUTH_RESPONSE,
+                            b"",
+                        ),
+                    )
+                    if not authenticated:
+                        self.log(f"! {peer}: неверный пароль")
+                    continue
+
+                if not authenticated:
+                    break
+
+                if packet_type != RCON_TYPE_EXEC:
+                    # Так отвечает Minecraft на пакет-маркер конца ответа
+                    await self._write(
+                        writer,
+                        self._packet(
+                            request_id,
+                            RCON_TYPE_RESPONSE,
+                            f"Unknown request {packet_type:x}".encode(),
+                        ),
+                    )
+                    continue
+
+                handled += 1
+                if (self.drop_after and handled > self.drop_after) or (
+                    random.random() < self.drop_rate
+                ):
+                    self.drops += 1
+                    self.log(f"✂ {peer}: соединение оборвано на команде {body!r}")
+                    break
+
+                delay = self.delay + random.uniform(0, self.jitter)
+                if delay:
+                    await asyncio.sleep(delay)
+                self.commands += 1
+                response = self.execute(body).encode("utf-8")
+                await self._write(
+                    writer,
+                    b"".join(
+                        self._packet(
+                            request_id,
+                            RCON_TYPE_RESPONSE,
+                            response[start : start + self.fragment_size],
+                        )
+                        for start in range(0, max(len(response), 1), self.fragment_size)
+                    ),
+                )
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            self.log(f"- {peer}")
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.log(f"RCON-заглушка слушает {self.host}:{self.port}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=25575)
+    parser.add_argument("--password", default="stub")
+    parser.add_argument("--delay", type=float, default=0.0, help="Задержка ответа, сек")
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Случайная добавка к задержке, сек"
+    )
+    parser.add_argument(
+        "--fragment-size",
+        type=int,
+        default=RCON_FRAGMENT_SIZE,
+        help="Размер фрагмента ответа, байт. Бот, как и клиенты Minecraft, "
+        "ждёт продолжения только после фрагмента ровно в 4096 байт",
+    )
+    parser.add_argument(
+        "--tcp-chunk",
+        type=int,
+        default=0,
+        help="Отправлять пакеты кусками по столько байт (проверка сборки из TCP)",
+    )
+    parser.add_argument(
+        "--reject-auth", action="store_true", help="Отклонять любой пароль"
+    )
+    parser.add_argument(
+        "--drop-rate",
+        type=float,
+        default=0.0,
+        help="Вероятность оборвать соединение вместо ответа на команду",
+    )
+    parser.add_argument(
+        "--drop-after",
+        type=int,
+        default=0,
+        help="Обрывать каждое соединение после стольких команд",
+    )
+    parser.add_argument(
+        "--whitelisted",
+        type=int,
+        default=0,
+        help="Сколько игроков заранее внести в вайтлист",
+    )
+    parser.add_argument("--quiet", action="store_true", help="Не печатать подключения")
+    return parser.parse_args()
+
+
+async def main(args):
+    server = RconStubServer(
+        args.host,
+        args.port,
+        args.password,
+        delay=args.delay,
+        jitter=args.jitter,
+        fragment_size=args.fragment_size,
+        tcp_chunk=args.tcp_chunk,
+        reject_auth=args.reject_auth,
+        drop_rate=args.drop_rate,
+        drop_after=args.drop_after,
+        whitelisted=args.whitelisted,
+        verbose=not args.quiet,
+    )
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+        print(
+            f"Соединений: {server.connections}, команд: {server.commands}, "
+            f"обрывов: {server.drops}"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    except KeyboardInterrupt:
+        pass